@@ -0,0 +1,698 @@
+"""
+Almacenamiento de asistencias en un registro de solo anexado (JSON Lines).
+
+Cada asistencia se guarda como una línea en el archivo de registros, por lo que
+registrar cuesta lo mismo con 10 o con 10 000 asistencias guardadas. Los datos
+del temporizador y de la sesión viven en un archivo de metadatos pequeño.
+Al iniciar se reconstruye el estado en memoria leyendo el registro, y si existe
+un estado.json del formato anterior se migra automáticamente.
+
+Las lecturas se sirven desde memoria. Las escrituras se acumulan y un hilo en
+segundo plano las vuelca a disco en bloque cada cierto intervalo o al juntar
+un número de registros pendientes (escritura diferida).
+
+Las modificaciones se serializan con un cerrojo del proceso y un bloqueo de
+archivo compartido entre procesos, de modo que varios hilos o workers pueden
+escribir a la vez sin perder asistencias. Antes de modificar, cada proceso lee
+lo que otros hayan anexado desde su última lectura. Los archivos que se
+reescriben completos se escriben en un temporal y se reemplazan con os.replace.
+
+Cada registro recibe un número de secuencia (`seq`) creciente al escribirse en
+disco; la secuencia continúa después de limpiar, de modo que un cliente puede
+pedir solo los registros posteriores al último que recibió.
+
+Un índice en memoria por sesión y DNI (y opcionalmente por correo) detecta en
+tiempo constante si una persona ya se registró en la sesión actual. Según la
+política configurada, el duplicado se rechaza, se fusiona con el registro
+existente o se permite. Una fusión anexa de nuevo el registro con su mismo seq;
+al releer el archivo, la última línea de cada seq reemplaza a las anteriores.
+
+La comprobación se hace dentro de la transacción, después de leer lo que otros
+procesos anexaron. Los registros pendientes de la escritura diferida solo los
+ve su propio proceso: con varios workers hay que usar volcado_intervalo=0, así
+cada registro se escribe antes de soltar el bloqueo de archivo.
+
+Los registros pueden traer un `id_cliente` generado por el navegador: reenviar
+un registro ya guardado (por ejemplo al reintentar un lote tras un corte de red)
+no crea una fila nueva. Al limpiar, sus `id_cliente` se conservan en
+`<archivo de registros>.ids`.
+
+Cada inicio del temporizador abre una sesión de asistencia; las sesiones se
+guardan en los metadatos y cada registro lleva el id de la suya. Para conservar
+el historial después de limpiar, usar el almacenamiento SQLite
+(almacenamiento_sqlite.py), que ofrece la misma interfaz.
+"""
+import bisect
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Políticas de sincronización a disco después de anexar un registro
+POLITICAS_FSYNC = ('siempre', 'intervalo', 'nunca')
+
+# Qué hacer cuando llega un DNI (o correo) ya registrado
+POLITICAS_DUPLICADOS = ('rechazar', 'fusionar', 'permitir')
+
+# Campos que conserva el registro original al fusionar un duplicado
+CAMPOS_NO_FUSIONABLES = ('seq', 'sesion', 'id_cliente', 'fecha_hora_servidor')
+
+# Implementaciones disponibles (variable de entorno ALMACENAMIENTO)
+TIPOS_ALMACENAMIENTO = ('jsonl', 'sqlite')
+
+META_INICIAL = {
+    "tiempo_inicial": 0,
+    "ultimo_inicio": None,
+    # Último número de secuencia usado antes de la última limpieza
+    "seq_base": 0,
+    # Cambia cada vez que se limpian los registros
+    "generacion": 0,
+    # Sesión única de administrador compartida entre workers
+    "admin_sesion": None,
+    # Sesión de asistencia más reciente (una por cada inicio del temporizador)
+    "sesion": None
+}
+
+
+def normalizar(valor):
+    """Clave de los índices de duplicados: sin espacios y en minúsculas"""
+    return str(valor or '').strip().lower()
+
+
+def fin_programado(inicio, tiempo_inicial):
+    """Fecha ISO en que termina una sesión según su inicio y su duración"""
+    return (datetime.fromisoformat(inicio) + timedelta(seconds=tiempo_inicial)).isoformat()
+
+
+def transicion_sesion(meta, cambios):
+    """Efecto de un cambio del temporizador sobre la sesión de asistencia.
+
+    Devuelve 'iniciar' si empieza un temporizador nuevo, 'detener' si se
+    detiene, 'extender' si cambia la duración del vigente, o None.
+    """
+    if 'ultimo_inicio' in cambios:
+        if cambios['ultimo_inicio'] and cambios['ultimo_inicio'] != meta.get('ultimo_inicio'):
+            return 'iniciar'
+        if not cambios['ultimo_inicio'] and meta.get('ultimo_inicio'):
+            return 'detener'
+    if meta.get('ultimo_inicio') and cambios.get('tiempo_inicial', meta.get('tiempo_inicial')) != meta.get('tiempo_inicial'):
+        return 'extender'
+    return None
+
+
+def _serializar(registro):
+    """Convierte un registro en una línea JSON compacta"""
+    return json.dumps(registro, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def escribir_atomico(ruta, contenido):
+    """Escribe el archivo completo en un temporal y lo reemplaza de una sola vez"""
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    descriptor, temporal = tempfile.mkstemp(
+        prefix='.' + os.path.basename(ruta) + '.', suffix='.tmp', dir=directorio)
+    try:
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+class BloqueoArchivo:
+    """Bloqueo exclusivo entre procesos basado en un archivo .lock"""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._archivo = None
+
+    def adquirir(self):
+        self._archivo = open(self.ruta, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_EX)
+        else:
+            self._archivo.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._archivo.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK reintenta durante 10 segundos antes de fallar
+                    continue
+
+    def liberar(self):
+        if self._archivo is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._archivo.fileno(), fcntl.LOCK_UN)
+        else:
+            self._archivo.seek(0)
+            msvcrt.locking(self._archivo.fileno(), msvcrt.LK_UNLCK, 1)
+        self._archivo.close()
+        self._archivo = None
+
+
+class AlmacenRegistros:
+    """Registro de asistencias en JSON Lines con metadatos en archivo aparte"""
+
+    def __init__(self, archivo_registros='registros.jsonl', archivo_meta='estado_meta.json',
+                 archivo_legado='estado.json', politica_fsync='intervalo', fsync_intervalo=1.0,
+                 volcado_intervalo=0.5, volcado_max_pendientes=50,
+                 politica_duplicados='rechazar', indexar_correo=False):
+        if politica_fsync not in POLITICAS_FSYNC:
+            raise ValueError(
+                f"Política de fsync inválida: {politica_fsync} (usa {', '.join(POLITICAS_FSYNC)})")
+        if politica_duplicados not in POLITICAS_DUPLICADOS:
+            raise ValueError(
+                f"Política de duplicados inválida: {politica_duplicados} "
+                f"(usa {', '.join(POLITICAS_DUPLICADOS)})")
+
+        self.archivo_registros = archivo_registros
+        self.archivo_meta = archivo_meta
+        # id_cliente de los registros ya limpiados, uno por línea
+        self.archivo_ids_limpiados = archivo_registros + '.ids'
+        self.archivo_legado = archivo_legado
+        self.politica_fsync = politica_fsync
+        self.fsync_intervalo = fsync_intervalo
+        self._ultimo_fsync = time.monotonic()
+        # Hay escrituras en el archivo que aún no pasaron por fsync
+        self._sin_fsync = False
+
+        # Escritura diferida: intervalo 0 escribe cada registro inmediatamente
+        self.volcado_intervalo = volcado_intervalo
+        self.volcado_max_pendientes = volcado_max_pendientes
+        self._pendientes = []
+        self._actualizaciones = []
+        self._evento_volcado = threading.Event()
+        self._hilo_volcado = None
+        # Lo activa cerrar(): el hilo de volcado termina. No se usa el estado del
+        # archivo porque _cargar_registros lo cierra y lo reabre al limpiar
+        self._cerrado = False
+
+        # Cerrojo del proceso (reentrante) + bloqueo de archivo entre procesos
+        self._cerrojo = threading.RLock()
+        self._bloqueo = BloqueoArchivo(archivo_registros + '.lock')
+        self._profundidad = 0
+
+        # Registros ya escritos, en el orden del archivo (seq creciente)
+        self.registros = []
+        self._seqs = []
+        self._ultimo_seq = 0
+
+        # Índices de duplicados: (sesión, clave normalizada) -> registro
+        self.politica_duplicados = politica_duplicados
+        self.indexar_correo = indexar_correo
+        self._por_dni = {}
+        self._por_correo = {}
+        # Claves de idempotencia de los registros guardados y de los limpiados:
+        # reenviar un lote después de limpiar tampoco crea filas
+        self._por_id_cliente = {}
+        self._ids_limpiados = set()
+
+        self.meta = dict(META_INICIAL)
+        self._archivo = None
+        self._posicion = 0
+        self._inodo = None
+        self._meta_firma = None
+
+        with self.transaccion(sincronizar=False):
+            self._migrar_legado()
+            self._cargar_meta()
+            self._cargar_registros()
+
+        self._iniciar_hilo_volcado()
+
+        # Un servidor pre-fork (gunicorn --preload) crea los workers copiando
+        # este proceso: cada hijo necesita sus propios cerrojos y su hilo
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _iniciar_hilo_volcado(self):
+        # El hilo también sincroniza a disco lo que quedó sin fsync (política 'intervalo')
+        if self.volcado_intervalo > 0 or (self.politica_fsync == 'intervalo'
+                                          and self.fsync_intervalo > 0):
+            self._hilo_volcado = threading.Thread(
+                target=self._bucle_volcado, name='volcado-registros', daemon=True)
+            self._hilo_volcado.start()
+
+    def _tras_fork(self):
+        self._cerrojo = threading.RLock()
+        self._bloqueo = BloqueoArchivo(self.archivo_registros + '.lock')
+        self._profundidad = 0
+        self._evento_volcado = threading.Event()
+        # Lo pendiente lo vuelca el proceso padre
+        self._pendientes = []
+        self._actualizaciones = []
+        self._iniciar_hilo_volcado()
+
+    # --- Exclusión mutua ---
+
+    @contextmanager
+    def transaccion(self, sincronizar=True):
+        """Serializa una modificación entre hilos y procesos.
+
+        Al entrar se incorporan los cambios que otros procesos hayan escrito,
+        así una lectura-modificación-escritura nunca parte de datos viejos.
+        """
+        with self._cerrojo:
+            if self._profundidad == 0:
+                self._bloqueo.adquirir()
+            self._profundidad += 1
+            try:
+                if sincronizar:
+                    self._sincronizar()
+                yield self
+            finally:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._bloqueo.liberar()
+
+    def actualizar(self):
+        """Incorpora cambios de otros procesos sin tomar el bloqueo de archivo"""
+        with self._cerrojo:
+            self._sincronizar()
+
+    def _sincronizar(self):
+        # Los metadatos se reemplazan completos: basta comparar inodo y fecha
+        if self._firma_meta() != self._meta_firma:
+            self._cargar_meta()
+
+        try:
+            estado_archivo = os.stat(self.archivo_registros)
+        except FileNotFoundError:
+            estado_archivo = None
+        if estado_archivo is None or estado_archivo.st_ino != self._inodo:
+            # Otro proceso limpió los registros reemplazando el archivo
+            self._cargar_registros()
+        elif estado_archivo.st_size > self._posicion:
+            self._leer_desde(self._posicion)
+
+    # --- Consultas ---
+
+    def total(self):
+        """Número de registros, incluidos los que aún no se vuelcan a disco"""
+        return len(self.registros) + len(self._pendientes)
+
+    def todos(self):
+        """Copia de todos los registros (los pendientes van al final)"""
+        with self._cerrojo:
+            return self.registros + self._pendientes
+
+    def buscar_duplicado(self, registro):
+        """Registro de la sesión actual con el mismo DNI (o correo, si se indexa), o None"""
+        sesion = self.meta.get('sesion')
+        dni = normalizar(registro.get('dni'))
+        if dni and (sesion, dni) in self._por_dni:
+            return self._por_dni[(sesion, dni)]
+        if self.indexar_correo:
+            correo = normalizar(registro.get('grupo_correo_electronico'))
+            if correo and (sesion, correo) in self._por_correo:
+                return self._por_correo[(sesion, correo)]
+        return None
+
+    def _indexar(self, registro):
+        if registro.get('id_cliente'):
+            self._por_id_cliente.setdefault(registro['id_cliente'], registro)
+        # Un DNI solo es duplicado dentro de la misma sesión de asistencia
+        sesion = registro.get('sesion')
+        dni = normalizar(registro.get('dni'))
+        if dni:
+            self._por_dni.setdefault((sesion, dni), registro)
+        if self.indexar_correo:
+            correo = normalizar(registro.get('grupo_correo_electronico'))
+            if correo:
+                self._por_correo.setdefault((sesion, correo), registro)
+
+    @property
+    def generacion(self):
+        return self.meta.get('generacion', 0)
+
+    def registros_desde(self, desde=0, limite=None):
+        """Registros ya guardados con seq mayor que `desde`, en orden de seq.
+
+        Búsqueda binaria sobre la lista de secuencias: el costo depende del
+        número de filas devueltas, no del total almacenado.
+        """
+        with self._cerrojo:
+            self._sincronizar()
+            inicio = bisect.bisect_right(self._seqs, desde)
+            fin = len(self.registros) if limite is None else inicio + limite
+            return self.registros[inicio:fin], self._ultimo_seq
+
+    def version(self):
+        """Sello que cambia con cada registro nuevo o limpieza.
+
+        Combina la generación (cambia al limpiar), el número de registros y el
+        contenido del último, sin recorrer la lista. Incluye lo que otros
+        procesos hayan escrito.
+        """
+        with self._cerrojo:
+            self._sincronizar()
+            return self._version()
+
+    def _version(self):
+        recientes = self._pendientes or self.registros
+        ultimo = ''
+        if recientes:
+            # Sin el seq, que se asigna al volcar y no cambia el contenido
+            ultimo = _serializar({clave: valor for clave, valor in recientes[-1].items()
+                                  if clave != 'seq'})
+        base = f"{self.generacion}:{self.total()}:{ultimo}"
+        return hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]
+
+    def instantanea(self):
+        """Devuelve (versión, copia de la lista de registros) de forma consistente"""
+        with self._cerrojo:
+            self._sincronizar()
+            return self._version(), self.registros + self._pendientes
+
+    def sesiones(self):
+        """Sesiones de asistencia con el número de registros que conservan"""
+        with self._cerrojo:
+            self._sincronizar()
+            totales = {}
+            for registro in self.registros + self._pendientes:
+                sesion = registro.get('sesion')
+                totales[sesion] = totales.get(sesion, 0) + 1
+            return [dict(sesion, total=totales.get(sesion['id'], 0))
+                    for sesion in self.meta.get('sesiones', [])]
+
+    def sesion_actual(self):
+        """Sesión de asistencia más reciente ({id, inicio, fin}), o None"""
+        with self._cerrojo:
+            self._sincronizar()
+            return next((dict(sesion) for sesion in self.meta.get('sesiones', [])
+                         if sesion['id'] == self.meta.get('sesion')), None)
+
+    def registros_de_sesion(self, sesion):
+        """Registros de una sesión (solo los que no se han limpiado)"""
+        with self._cerrojo:
+            self._sincronizar()
+            return [registro for registro in self.registros + self._pendientes
+                    if registro.get('sesion') == sesion]
+
+    # --- Carga inicial ---
+
+    def _migrar_legado(self):
+        """Convierte un estado.json antiguo al formato de registro + metadatos"""
+        if not self.archivo_legado or not os.path.exists(self.archivo_legado):
+            return
+        if os.path.exists(self.archivo_registros):
+            return
+
+        with open(self.archivo_legado, 'r', encoding='utf-8') as f:
+            estado = json.load(f)
+
+        escribir_atomico(self.archivo_registros, ''.join(
+            _serializar(dict(registro, seq=seq))
+            for seq, registro in enumerate(estado.get('registros', []), 1)))
+
+        meta = {clave: estado.get(clave, valor)
+                for clave, valor in META_INICIAL.items()}
+        self._escribir_meta(meta)
+
+        # Conservar el archivo original como respaldo
+        os.replace(self.archivo_legado, self.archivo_legado + '.migrado')
+
+    def _firma_meta(self):
+        try:
+            info = os.stat(self.archivo_meta)
+        except FileNotFoundError:
+            return None
+        return (info.st_ino, info.st_mtime_ns)
+
+    def _cargar_meta(self):
+        self.meta = dict(META_INICIAL)
+        try:
+            with open(self.archivo_meta, 'r', encoding='utf-8') as f:
+                self.meta.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        self._meta_firma = self._firma_meta()
+
+    def _cargar_registros(self):
+        """Reconstruye la lista de registros leyendo el archivo línea por línea"""
+        if self._archivo is not None:
+            self._archivo.close()
+        self._archivo = open(self.archivo_registros, 'a', encoding='utf-8')
+        self._inodo = os.fstat(self._archivo.fileno()).st_ino
+        self.registros = []
+        self._seqs = []
+        self._por_dni = {}
+        self._por_correo = {}
+        self._por_id_cliente = {}
+        self._ids_limpiados = self._leer_ids_limpiados()
+        self._ultimo_seq = self.meta.get('seq_base', 0)
+        self._posicion = 0
+        self._leer_desde(0)
+        # Los pendientes de este proceso siguen contando como registrados
+        for registro in self._pendientes:
+            self._indexar(registro)
+
+        # Descartar una cola corrupta (escritura interrumpida) para que el
+        # siguiente anexo no se mezcle con ella; solo es seguro con el bloqueo
+        if self._profundidad and self._posicion < os.fstat(self._archivo.fileno()).st_size:
+            self._archivo.truncate(self._posicion)
+
+    def _leer_ids_limpiados(self):
+        try:
+            with open(self.archivo_ids_limpiados, 'r', encoding='utf-8') as f:
+                return {linea.rstrip('\n') for linea in f if linea.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _leer_desde(self, posicion):
+        """Añade a memoria las líneas completas escritas a partir de `posicion`"""
+        with open(self.archivo_registros, 'rb') as f:
+            f.seek(posicion)
+            for linea in f:
+                # Una línea sin salto final es una escritura en curso o interrumpida
+                if not linea.endswith(b'\n'):
+                    break
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    break
+                self._incorporar(registro)
+                posicion += len(linea)
+        self._posicion = posicion
+
+    def _incorporar(self, registro):
+        # Los registros anteriores a los números de secuencia toman el siguiente
+        seq = registro.setdefault('seq', self._ultimo_seq + 1)
+
+        # Un seq repetido es una fusión: reemplaza al registro anterior
+        indice = bisect.bisect_left(self._seqs, seq)
+        if indice < len(self._seqs) and self._seqs[indice] == seq:
+            self.registros[indice].clear()
+            self.registros[indice].update(registro)
+            self._indexar(self.registros[indice])
+            return
+
+        self._ultimo_seq = max(self._ultimo_seq, seq)
+        self.registros.append(registro)
+        self._seqs.append(seq)
+        self._indexar(registro)
+
+    # --- Escritura ---
+
+    def _aplicar_fsync(self):
+        if self.politica_fsync == 'nunca':
+            return
+        ahora = time.monotonic()
+        if self.politica_fsync == 'siempre' or ahora - self._ultimo_fsync >= self.fsync_intervalo:
+            os.fsync(self._archivo.fileno())
+            self._ultimo_fsync = ahora
+            self._sin_fsync = False
+        else:
+            # Lo sincroniza el hilo de volcado al cumplirse el intervalo
+            self._sin_fsync = True
+
+    def _fsync_vencido(self):
+        """fsync de las escrituras que llevan más de `fsync_intervalo` sin sincronizar"""
+        with self._cerrojo:
+            if not self._sin_fsync or self._archivo is None or self._archivo.closed:
+                return
+            ahora = time.monotonic()
+            if ahora - self._ultimo_fsync >= self.fsync_intervalo:
+                os.fsync(self._archivo.fileno())
+                self._ultimo_fsync = ahora
+                self._sin_fsync = False
+
+    def agregar(self, registro):
+        """Añade un registro en memoria y lo encola para anexarlo al archivo.
+
+        Devuelve (total, duplicado). Con la política 'rechazar' un duplicado
+        no se guarda; con 'fusionar' actualiza los datos del registro existente.
+        """
+        total, (estado,) = self.agregar_lote([registro])
+        return total, estado == 'duplicado'
+
+    def agregar_lote(self, registros):
+        """Añade varios registros bajo un solo cerrojo y los encola juntos.
+
+        Devuelve (total, estados) con un estado por registro: 'registrado',
+        'repetido' (su id_cliente ya estaba guardado) o 'duplicado' (DNI o
+        correo ya registrado, tratado según la política de duplicados).
+        """
+        # La comprobación de duplicados y la inserción van bajo el bloqueo de
+        # archivo y parten de lo que otros procesos ya escribieron
+        with self.transaccion():
+            estados = [self._agregar(registro) for registro in registros]
+            if self.volcado_intervalo <= 0:
+                # Escribir antes de soltar el bloqueo: el siguiente worker que
+                # compruebe duplicados ya ve estos registros
+                self.volcar()
+            total = self.total()
+            escrituras = len(self._pendientes) + len(self._actualizaciones)
+
+        if escrituras >= self.volcado_max_pendientes:
+            self._evento_volcado.set()
+        return total, estados
+
+    def _agregar(self, registro):
+        id_cliente = registro.get('id_cliente')
+        if id_cliente in self._por_id_cliente or id_cliente in self._ids_limpiados:
+            return 'repetido'
+
+        existente = None
+        if self.politica_duplicados != 'permitir':
+            existente = self.buscar_duplicado(registro)
+
+        if existente is None:
+            registro['sesion'] = self.meta.get('sesion')
+            self._pendientes.append(registro)
+            self._indexar(registro)
+            return 'registrado'
+        if self.politica_duplicados == 'fusionar':
+            existente.update({clave: valor for clave, valor in registro.items()
+                              if clave not in CAMPOS_NO_FUSIONABLES})
+            # Si ya está en disco se anexa de nuevo con su mismo seq
+            if 'seq' in existente:
+                self._actualizaciones.append(existente)
+        return 'duplicado'
+
+    def limpiar(self):
+        """Elimina todos los registros (los metadatos se conservan)"""
+        with self.transaccion():
+            # Conservar las claves de idempotencia de lo que se borra
+            ids = ''.join(registro['id_cliente'] + '\n'
+                          for registro in self.registros + self._pendientes
+                          if registro.get('id_cliente'))
+            if ids:
+                with open(self.archivo_ids_limpiados, 'a', encoding='utf-8') as f:
+                    f.write(ids)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._pendientes = []
+            self._actualizaciones = []
+            self.meta['seq_base'] = self._ultimo_seq
+            self.meta['generacion'] = self.generacion + 1
+            self._escribir_meta(self.meta)
+            self._meta_firma = self._firma_meta()
+            escribir_atomico(self.archivo_registros, '')
+            self._cargar_registros()
+
+    def _escribir_meta(self, meta):
+        escribir_atomico(self.archivo_meta, json.dumps(
+            meta, ensure_ascii=False, indent=2))
+
+    def guardar_meta(self, **cambios):
+        """Actualiza los datos del temporizador y los persiste de inmediato.
+
+        Los metadatos son pequeños y cambian pocas veces (acciones del
+        administrador), y los demás procesos deben verlos al instante.
+        """
+        with self.transaccion():
+            self._registrar_sesion(cambios)
+            self.meta.update(cambios)
+            self._escribir_meta(self.meta)
+            self._meta_firma = self._firma_meta()
+
+    def _registrar_sesion(self, cambios):
+        """Abre, extiende o cierra la sesión de asistencia según el temporizador"""
+        accion = transicion_sesion(self.meta, cambios)
+        if accion is None:
+            return
+        ahora = datetime.now().isoformat()
+        sesiones = [dict(sesion) for sesion in self.meta.get('sesiones', [])]
+        actual = next((sesion for sesion in sesiones
+                       if sesion['id'] == self.meta.get('sesion')), None)
+
+        if accion == 'iniciar':
+            # Un nuevo inicio termina la sesión anterior si seguía abierta
+            if actual is not None and actual['fin'] > ahora:
+                actual['fin'] = ahora
+            nueva = {
+                'id': sesiones[-1]['id'] + 1 if sesiones else 1,
+                'inicio': cambios['ultimo_inicio'],
+                'fin': fin_programado(cambios['ultimo_inicio'], cambios.get('tiempo_inicial', 0))
+            }
+            sesiones.append(nueva)
+            cambios['sesion'] = nueva['id']
+        elif actual is not None:
+            actual['fin'] = ahora if accion == 'detener' else fin_programado(
+                self.meta['ultimo_inicio'], cambios['tiempo_inicial'])
+        cambios['sesiones'] = sesiones
+
+    def archivos(self):
+        """Archivos de datos en disco (para el tamaño publicado en las métricas)"""
+        return [self.archivo_registros, self.archivo_meta, self.archivo_ids_limpiados]
+
+    # --- Volcado a disco ---
+
+    def volcar(self):
+        """Escribe en disco los registros pendientes asignándoles su seq"""
+        with self._cerrojo:
+            if self._archivo is None or self._archivo.closed:
+                return
+            if not self._pendientes and not self._actualizaciones:
+                return
+            # Leer lo que otros procesos anexaron para continuar su secuencia
+            with self.transaccion():
+                pendientes = self._pendientes
+                for registro in pendientes:
+                    registro['seq'] = self._ultimo_seq + 1
+                    self._ultimo_seq += 1
+                bloque = ''.join(_serializar(registro)
+                                 for registro in self._actualizaciones + pendientes)
+                self._actualizaciones = []
+                self._archivo.write(bloque)
+                self._archivo.flush()
+                self._aplicar_fsync()
+                self._posicion += len(bloque.encode('utf-8'))
+                self.registros.extend(pendientes)
+                self._seqs.extend(registro['seq'] for registro in pendientes)
+                self._pendientes = []
+
+    def _bucle_volcado(self):
+        espera = self.volcado_intervalo if self.volcado_intervalo > 0 else self.fsync_intervalo
+        while not self._cerrado:
+            self._evento_volcado.wait(espera)
+            self._evento_volcado.clear()
+            if self.volcado_intervalo > 0:
+                self.volcar()
+            self._fsync_vencido()
+
+    def cerrar(self):
+        """Vuelca lo pendiente y cierra el archivo (seguro de llamar varias veces)"""
+        self.volcar()
+        with self._cerrojo:
+            self._cerrado = True
+            if self._archivo is not None and not self._archivo.closed:
+                os.fsync(self._archivo.fileno())
+                self._archivo.close()
+        self._evento_volcado.set()
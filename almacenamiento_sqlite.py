@@ -0,0 +1,507 @@
+"""
+Almacenamiento de asistencias en SQLite (modo WAL).
+
+Ofrece la misma interfaz que AlmacenRegistros (almacenamiento.py) pero conserva
+el historial: cada inicio del temporizador crea una fila en `sesiones` y cada
+asistencia es una fila en `registros`, con índices por sesión, DNI y fecha.
+Registrar es un único INSERT dentro de una transacción y las consultas usan los
+índices, así que su costo no crece con el historial acumulado.
+
+Limpiar no borra filas: archiva la generación actual y empieza una nueva. Los
+registros archivados ya no cuentan para el formulario, pero las sesiones
+anteriores se siguen pudiendo consultar y exportar.
+
+En modo WAL los lectores no bloquean al escritor, y varios hilos o workers
+pueden usar la misma base. Cada proceso guarda en memoria los metadatos y el
+total, y solo los vuelve a leer cuando `PRAGMA data_version` indica que otra
+conexión escribió en la base.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from almacenamiento import (CAMPOS_NO_FUSIONABLES, META_INICIAL, POLITICAS_DUPLICADOS,
+                            POLITICAS_FSYNC, fin_programado, normalizar, transicion_sesion)
+
+# Nivel de sincronización de SQLite equivalente a cada política de fsync
+SINCRONIZACION = {'siempre': 'FULL', 'intervalo': 'NORMAL', 'nunca': 'OFF'}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sesiones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    inicio TEXT NOT NULL,
+    fin TEXT
+);
+CREATE TABLE IF NOT EXISTS generaciones (
+    generacion INTEGER PRIMARY KEY,
+    total INTEGER NOT NULL DEFAULT 0,
+    -- Aumenta con cada inserción o fusión: forma parte de la versión de los datos
+    cambios INTEGER NOT NULL DEFAULT 0,
+    archivada TEXT
+);
+CREATE TABLE IF NOT EXISTS registros (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    generacion INTEGER NOT NULL,
+    sesion_id INTEGER REFERENCES sesiones(id),
+    dni TEXT,
+    correo TEXT,
+    creado TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    id_cliente TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_registros_generacion ON registros(generacion, seq);
+CREATE INDEX IF NOT EXISTS idx_registros_sesion ON registros(sesion_id, seq);
+CREATE INDEX IF NOT EXISTS idx_registros_creado ON registros(creado);
+"""
+
+# Índices sobre columnas añadidas después de la primera versión del esquema
+INDICES_POSTERIORES = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_registros_id_cliente ON registros(id_cliente);
+-- Los duplicados se buscan por sesión (antes, por generación)
+DROP INDEX IF EXISTS idx_registros_dni;
+DROP INDEX IF EXISTS idx_registros_correo;
+CREATE INDEX IF NOT EXISTS idx_registros_sesion_dni ON registros(sesion_id, dni);
+CREATE INDEX IF NOT EXISTS idx_registros_sesion_correo ON registros(sesion_id, correo);
+"""
+
+# Columnas que no se guardan dentro de `datos`
+CAMPOS_COLUMNA = ('seq', 'sesion', 'id_cliente')
+
+
+def _datos(registro):
+    return json.dumps({clave: valor for clave, valor in registro.items()
+                       if clave not in CAMPOS_COLUMNA},
+                      ensure_ascii=False, separators=(',', ':'))
+
+
+# Columnas con las que se reconstruye un registro (ver _registro)
+COLUMNAS_REGISTRO = 'seq, sesion_id, id_cliente, datos'
+
+
+def _registro(fila):
+    """Convierte una fila (seq, sesion_id, id_cliente, datos) en el diccionario del registro"""
+    seq, sesion, id_cliente, datos = fila
+    registro = json.loads(datos)
+    registro['seq'] = seq
+    registro['sesion'] = sesion
+    if id_cliente is not None:
+        registro['id_cliente'] = id_cliente
+    return registro
+
+
+def _fecha_iso(registro):
+    """Fecha de creación ordenable a partir de la fecha/hora del servidor"""
+    try:
+        return datetime.strptime(registro['fecha_hora_servidor'], '%d/%m/%Y %H:%M:%S').isoformat()
+    except (KeyError, TypeError, ValueError):
+        return datetime.now().isoformat(timespec='seconds')
+
+
+class AlmacenSQLite:
+    """Registro de asistencias e historial de sesiones en una base SQLite"""
+
+    def __init__(self, archivo='asistencias.db', archivo_registros='registros.jsonl',
+                 archivo_meta='estado_meta.json', archivo_legado='estado.json',
+                 politica_fsync='intervalo', politica_duplicados='rechazar', indexar_correo=False):
+        if politica_fsync not in POLITICAS_FSYNC:
+            raise ValueError(
+                f"Política de fsync inválida: {politica_fsync} (usa {', '.join(POLITICAS_FSYNC)})")
+        if politica_duplicados not in POLITICAS_DUPLICADOS:
+            raise ValueError(
+                f"Política de duplicados inválida: {politica_duplicados} "
+                f"(usa {', '.join(POLITICAS_DUPLICADOS)})")
+
+        self.archivo = archivo
+        # Archivos del almacenamiento JSON Lines o del formato anterior a migrar
+        self.archivo_registros = archivo_registros
+        self.archivo_meta = archivo_meta
+        self.archivo_legado = archivo_legado
+        self.politica_fsync = politica_fsync
+        self.politica_duplicados = politica_duplicados
+        self.indexar_correo = indexar_correo
+
+        # Una conexión por proceso, compartida por los hilos bajo un cerrojo
+        self._cerrojo = threading.RLock()
+        self._profundidad = 0
+        self._conexion = self._conectar()
+        self._conexiones_heredadas = []
+
+        self.meta = dict(META_INICIAL)
+        self._total = 0
+        self._cambios = 0
+        self._data_version = None
+
+        with self.transaccion(sincronizar=False):
+            self._migrar()
+            self._cargar()
+            self._conexion.execute(
+                'INSERT OR IGNORE INTO generaciones (generacion) VALUES (?)', (self.generacion,))
+        self._data_version = self._leer_data_version()
+
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.archivo, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        conexion.execute('PRAGMA journal_mode=WAL')
+        conexion.execute(f'PRAGMA synchronous={SINCRONIZACION[self.politica_fsync]}')
+        conexion.executescript(ESQUEMA)
+        # Bases creadas antes de las claves de idempotencia
+        conexion.execute('BEGIN IMMEDIATE')
+        columnas = [fila[1] for fila in conexion.execute('PRAGMA table_info(registros)')]
+        if 'id_cliente' not in columnas:
+            conexion.execute('ALTER TABLE registros ADD COLUMN id_cliente TEXT')
+        conexion.execute('COMMIT')
+        conexion.executescript(INDICES_POSTERIORES)
+        return conexion
+
+    def _tras_fork(self):
+        # Una conexión SQLite no debe usarse ni cerrarse en el proceso hijo:
+        # se conserva la referencia para que no se cierre al liberarse
+        self._conexiones_heredadas.append(self._conexion)
+        self._cerrojo = threading.RLock()
+        self._profundidad = 0
+        self._conexion = self._conectar()
+        self._data_version = None
+
+    # --- Exclusión mutua ---
+
+    @contextmanager
+    def transaccion(self, sincronizar=True):
+        """Transacción de escritura (BEGIN IMMEDIATE) serializada entre hilos y procesos.
+
+        Si la operación falla se deshace completa y los datos en memoria se
+        vuelven a leer de la base.
+        """
+        with self._cerrojo:
+            if self._profundidad == 0:
+                self._conexion.execute('BEGIN IMMEDIATE')
+            self._profundidad += 1
+            try:
+                if sincronizar:
+                    self._sincronizar()
+                yield self
+            except BaseException:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._conexion.execute('ROLLBACK')
+                    self._data_version = None
+                raise
+            else:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    self._conexion.execute('COMMIT')
+
+    def actualizar(self):
+        """Incorpora los cambios de otros procesos (una consulta PRAGMA si no hay)"""
+        with self._cerrojo:
+            self._sincronizar()
+
+    def _leer_data_version(self):
+        return self._conexion.execute('PRAGMA data_version').fetchone()[0]
+
+    def _sincronizar(self):
+        # data_version solo cambia cuando escribe otra conexión
+        version = self._leer_data_version()
+        if version != self._data_version:
+            self._cargar()
+            self._data_version = version
+
+    def _cargar(self):
+        self.meta = dict(META_INICIAL)
+        for clave, valor in self._conexion.execute('SELECT clave, valor FROM meta'):
+            self.meta[clave] = json.loads(valor)
+        fila = self._conexion.execute(
+            'SELECT total, cambios FROM generaciones WHERE generacion = ?',
+            (self.generacion,)).fetchone()
+        self._total, self._cambios = fila or (0, 0)
+
+    # --- Consultas ---
+
+    @property
+    def generacion(self):
+        return self.meta.get('generacion', 0)
+
+    def total(self):
+        """Número de registros de la generación actual"""
+        return self._total
+
+    def todos(self):
+        """Todos los registros de la generación actual, en orden de seq"""
+        with self._cerrojo:
+            return [_registro(fila) for fila in self._conexion.execute(
+                f'SELECT {COLUMNAS_REGISTRO} FROM registros WHERE generacion = ? ORDER BY seq',
+                (self.generacion,))]
+
+    def buscar_duplicado(self, registro):
+        """Registro de la sesión actual con el mismo DNI (o correo, si se indexa), o None"""
+        claves = [('dni', normalizar(registro.get('dni')))]
+        if self.indexar_correo:
+            claves.append(('correo', normalizar(registro.get('grupo_correo_electronico'))))
+        with self._cerrojo:
+            for columna, valor in claves:
+                if not valor:
+                    continue
+                fila = self._conexion.execute(
+                    f'SELECT {COLUMNAS_REGISTRO} FROM registros '
+                    f'WHERE sesion_id IS ? AND generacion = ? AND {columna} = ? '
+                    'ORDER BY seq LIMIT 1',
+                    (self.meta.get('sesion'), self.generacion, valor)).fetchone()
+                if fila is not None:
+                    return _registro(fila)
+        return None
+
+    def registros_desde(self, desde=0, limite=None):
+        """Registros de la generación actual con seq mayor que `desde`, en orden"""
+        with self._cerrojo:
+            self._sincronizar()
+            registros = [_registro(fila) for fila in self._conexion.execute(
+                f'SELECT {COLUMNAS_REGISTRO} FROM registros '
+                'WHERE generacion = ? AND seq > ? ORDER BY seq LIMIT ?',
+                (self.generacion, desde, -1 if limite is None else limite))]
+            return registros, self._ultimo_seq()
+
+    def _ultimo_seq(self):
+        ultimo = self._conexion.execute(
+            'SELECT MAX(seq) FROM registros WHERE generacion = ?',
+            (self.generacion,)).fetchone()[0]
+        return ultimo or self.meta.get('seq_base', 0)
+
+    def version(self):
+        """Sello que cambia con cada registro nuevo, fusión o limpieza (de cualquier proceso)"""
+        with self._cerrojo:
+            self._sincronizar()
+            return self._version()
+
+    def _version(self):
+        base = f"{self.generacion}:{self._total}:{self._cambios}"
+        return hashlib.sha1(base.encode('utf-8')).hexdigest()[:16]
+
+    def instantanea(self):
+        """Devuelve (versión, registros de la generación actual) de forma consistente"""
+        with self._cerrojo:
+            self._sincronizar()
+            return self._version(), self.todos()
+
+    def sesiones(self):
+        """Historial de sesiones de asistencia con su número de registros"""
+        with self._cerrojo:
+            return [{'id': id_sesion, 'inicio': inicio, 'fin': fin, 'total': total}
+                    for id_sesion, inicio, fin, total in self._conexion.execute(
+                        'SELECT s.id, s.inicio, s.fin, COUNT(r.seq) FROM sesiones s '
+                        'LEFT JOIN registros r ON r.sesion_id = s.id '
+                        'GROUP BY s.id ORDER BY s.id')]
+
+    def sesion_actual(self):
+        """Sesión de asistencia más reciente ({id, inicio, fin}), o None"""
+        with self._cerrojo:
+            self._sincronizar()
+            fila = self._conexion.execute(
+                'SELECT id, inicio, fin FROM sesiones WHERE id = ?',
+                (self.meta.get('sesion'),)).fetchone()
+        if fila is None:
+            return None
+        return {'id': fila[0], 'inicio': fila[1], 'fin': fila[2]}
+
+    def registros_de_sesion(self, sesion):
+        """Registros de una sesión, incluidos los archivados al limpiar"""
+        with self._cerrojo:
+            return [_registro(fila) for fila in self._conexion.execute(
+                f'SELECT {COLUMNAS_REGISTRO} FROM registros WHERE sesion_id = ? ORDER BY seq',
+                (sesion,))]
+
+    # --- Migración ---
+
+    def _migrar(self):
+        """Importa los datos del almacenamiento JSON Lines o de un estado.json antiguo"""
+        if self._conexion.execute('SELECT 1 FROM meta LIMIT 1').fetchone():
+            return
+
+        meta = dict(META_INICIAL)
+        registros = {}
+        if self.archivo_registros and os.path.exists(self.archivo_registros):
+            if self.archivo_meta and os.path.exists(self.archivo_meta):
+                with open(self.archivo_meta, 'r', encoding='utf-8') as f:
+                    meta.update(json.load(f))
+            with open(self.archivo_registros, 'rb') as f:
+                for linea in f:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        break
+                    # La última línea de cada seq es la vigente (fusiones)
+                    registros[registro.get('seq', len(registros) + 1)] = registro
+            legado = None
+        elif self.archivo_legado and os.path.exists(self.archivo_legado):
+            with open(self.archivo_legado, 'r', encoding='utf-8') as f:
+                legado = json.load(f)
+            meta.update({clave: legado.get(clave, valor)
+                         for clave, valor in META_INICIAL.items()})
+            registros = dict(enumerate(legado.get('registros', []), 1))
+        else:
+            return
+
+        for sesion in meta.pop('sesiones', []):
+            self._conexion.execute(
+                'INSERT INTO sesiones (id, inicio, fin) VALUES (?, ?, ?)',
+                (sesion['id'], sesion['inicio'], sesion['fin']))
+        for seq, registro in sorted(registros.items()):
+            self._conexion.execute(
+                'INSERT INTO registros (seq, generacion, sesion_id, dni, correo, creado, datos, id_cliente) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (seq, meta['generacion'], registro.get('sesion'),
+                 normalizar(registro.get('dni')),
+                 normalizar(registro.get('grupo_correo_electronico')),
+                 _fecha_iso(registro), _datos(registro), registro.get('id_cliente') or None))
+        self._conexion.execute(
+            'INSERT INTO generaciones (generacion, total, cambios) VALUES (?, ?, ?)',
+            (meta['generacion'], len(registros), len(registros)))
+
+        # La secuencia continúa donde quedó, aunque se hubiera limpiado
+        seq_maximo = max(list(registros) + [meta.get('seq_base', 0)])
+        if seq_maximo:
+            self._conexion.execute("DELETE FROM sqlite_sequence WHERE name = 'registros'")
+            self._conexion.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES ('registros', ?)", (seq_maximo,))
+        self._escribir_meta(**meta)
+
+        # Los archivos JSON Lines se conservan; el estado.json antiguo se renombra
+        if legado is not None:
+            os.replace(self.archivo_legado, self.archivo_legado + '.migrado')
+
+    # --- Escritura ---
+
+    def agregar(self, registro):
+        """Inserta un registro (una fila) en la generación y sesión actuales.
+
+        Devuelve (total, duplicado). Con la política 'rechazar' un duplicado
+        no se guarda; con 'fusionar' actualiza los datos del registro existente.
+        """
+        total, (estado,) = self.agregar_lote([registro])
+        return total, estado == 'duplicado'
+
+    def agregar_lote(self, registros):
+        """Inserta varios registros en una sola transacción (un solo commit).
+
+        Devuelve (total, estados) con un estado por registro: 'registrado',
+        'repetido' (su id_cliente ya estaba guardado) o 'duplicado' (DNI o
+        correo ya registrado, tratado según la política de duplicados).
+        """
+        with self.transaccion():
+            estados = [self._agregar(registro) for registro in registros]
+            total = self._total
+        return total, estados
+
+    def _agregar(self, registro):
+        # Las claves de idempotencia valen también para registros archivados
+        if registro.get('id_cliente') and self._conexion.execute(
+                'SELECT 1 FROM registros WHERE id_cliente = ?',
+                (registro['id_cliente'],)).fetchone():
+            return 'repetido'
+
+        existente = None
+        if self.politica_duplicados != 'permitir':
+            existente = self.buscar_duplicado(registro)
+
+        if existente is None:
+            cursor = self._conexion.execute(
+                'INSERT INTO registros (generacion, sesion_id, dni, correo, creado, datos, id_cliente) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (self.generacion, self.meta.get('sesion'),
+                 normalizar(registro.get('dni')),
+                 normalizar(registro.get('grupo_correo_electronico')),
+                 datetime.now().isoformat(timespec='seconds'), _datos(registro),
+                 registro.get('id_cliente') or None))
+            registro['seq'] = cursor.lastrowid
+            registro['sesion'] = self.meta.get('sesion')
+            self._contar(1)
+            return 'registrado'
+        if self.politica_duplicados == 'fusionar':
+            existente.update({clave: valor for clave, valor in registro.items()
+                              if clave not in CAMPOS_NO_FUSIONABLES})
+            self._conexion.execute(
+                'UPDATE registros SET dni = ?, correo = ?, datos = ? WHERE seq = ?',
+                (normalizar(existente.get('dni')),
+                 normalizar(existente.get('grupo_correo_electronico')),
+                 _datos(existente), existente['seq']))
+            self._contar(0)
+        return 'duplicado'
+
+    def _contar(self, nuevos):
+        self._conexion.execute(
+            'UPDATE generaciones SET total = total + ?, cambios = cambios + 1 '
+            'WHERE generacion = ?', (nuevos, self.generacion))
+        self._total += nuevos
+        self._cambios += 1
+
+    def limpiar(self):
+        """Archiva los registros actuales y empieza una generación vacía"""
+        with self.transaccion():
+            self._conexion.execute(
+                'UPDATE generaciones SET archivada = ? WHERE generacion = ?',
+                (datetime.now().isoformat(), self.generacion))
+            seq_base = self._ultimo_seq()
+            generacion = self.generacion + 1
+            self._conexion.execute(
+                'INSERT OR IGNORE INTO generaciones (generacion) VALUES (?)', (generacion,))
+            self._escribir_meta(generacion=generacion, seq_base=seq_base)
+            self._total = 0
+            self._cambios = 0
+
+    def _escribir_meta(self, **cambios):
+        self._conexion.executemany(
+            'INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)',
+            [(clave, json.dumps(valor, ensure_ascii=False)) for clave, valor in cambios.items()])
+        self.meta.update(cambios)
+
+    def guardar_meta(self, **cambios):
+        """Actualiza los datos del temporizador o de la sesión de administrador"""
+        with self.transaccion():
+            self._registrar_sesion(cambios)
+            self._escribir_meta(**cambios)
+
+    def _registrar_sesion(self, cambios):
+        """Abre, extiende o cierra la sesión de asistencia según el temporizador"""
+        accion = transicion_sesion(self.meta, cambios)
+        if accion is None:
+            return
+        ahora = datetime.now().isoformat()
+        actual = self.meta.get('sesion')
+
+        if accion == 'iniciar':
+            # Un nuevo inicio termina la sesión anterior si seguía abierta
+            if actual is not None:
+                self._conexion.execute(
+                    'UPDATE sesiones SET fin = ? WHERE id = ? AND fin > ?', (ahora, actual, ahora))
+            cursor = self._conexion.execute(
+                'INSERT INTO sesiones (inicio, fin) VALUES (?, ?)',
+                (cambios['ultimo_inicio'],
+                 fin_programado(cambios['ultimo_inicio'], cambios.get('tiempo_inicial', 0))))
+            cambios['sesion'] = cursor.lastrowid
+        elif actual is not None:
+            fin = ahora if accion == 'detener' else fin_programado(
+                self.meta['ultimo_inicio'], cambios['tiempo_inicial'])
+            self._conexion.execute('UPDATE sesiones SET fin = ? WHERE id = ?', (fin, actual))
+
+    def archivos(self):
+        """Archivos de datos en disco (para el tamaño publicado en las métricas)"""
+        return [self.archivo, self.archivo + '-wal']
+
+    def volcar(self):
+        """Sin efecto: cada registro se escribe al insertarlo"""
+
+    def cerrar(self):
+        """Cierra la conexión (seguro de llamar varias veces)"""
+        with self._cerrojo:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark del arranque del servidor: importación y primera respuesta
+
+Mide, cada vez en un proceso nuevo y con los datos en una carpeta temporal:
+  - importar servidor.py (módulos, almacenamiento, archivos estáticos)
+  - iniciar `servidor.py --produccion` hasta que /api/estado responde
+
+Con --registros se precargan asistencias para medir también la carga de los
+datos. --detalle muestra los módulos que más tardan en importarse.
+
+Uso:
+    python3 benchmark_arranque.py --salida antes.json
+    # ... cambios ...
+    python3 benchmark_arranque.py --comparar antes.json
+    python3 benchmark_arranque.py --repo /ruta/a/otra/copia --registros 20000
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+
+def preparar_datos(directorio, cantidad):
+    """Escribe `cantidad` asistencias en registros.jsonl (formato del almacenamiento)"""
+    with open(os.path.join(directorio, 'registros.jsonl'), 'w', encoding='utf-8') as f:
+        for i in range(cantidad):
+            f.write(json.dumps({
+                'apellido_paterno': f'APELLIDO{i}',
+                'apellido_materno': 'MATERNO',
+                'nombres': 'NOMBRE DE PRUEBA',
+                'dni': f'{i:08d}',
+                'cargo_numero_telefonico': '904076044',
+                'grupo_correo_electronico': f'PERSONA{i}@TRABAJO.GOB.PE',
+                'area_organizacional': 'Dirección General del Trabajo - DGT',
+                'centro_trabajo': 'SEDE CENTRAL',
+                'fecha_hora_servidor': '18/10/2026 10:00:00',
+                'seq': i + 1
+            }, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+
+def entorno():
+    variables = dict(os.environ)
+    # La IP fija evita que la medición dependa de la red (versiones con IP_LOCAL)
+    variables.setdefault('IP_LOCAL', '127.0.0.1')
+    return variables
+
+
+def medir_importacion(repo, directorio):
+    """Segundos en importar servidor.py en un proceso nuevo"""
+    codigo = (
+        "import sys, time\n"
+        f"sys.path.insert(0, {repo!r})\n"
+        "inicio = time.perf_counter()\n"
+        "import servidor\n"
+        "print(time.perf_counter() - inicio)\n"
+    )
+    salida = subprocess.run([sys.executable, '-c', codigo], cwd=directorio, env=entorno(),
+                            capture_output=True, text=True, check=True)
+    return float(salida.stdout.strip().splitlines()[-1])
+
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def medir_primera_respuesta(repo, directorio, tiempo_maximo=30.0):
+    """Segundos desde lanzar el servidor hasta la primera respuesta de /api/estado"""
+    puerto = puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(repo, 'servidor.py'), '--produccion',
+         '--puerto', str(puerto), '--hilos', '4'],
+        cwd=directorio, env=entorno(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - inicio < tiempo_maximo:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{puerto}/api/estado', timeout=1):
+                    return time.perf_counter() - inicio
+            except OSError:
+                time.sleep(0.005)
+        return None
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def detalle_importacion(repo, directorio, cantidad=10):
+    """Módulos de primer nivel que más tardan en importarse (python -X importtime)"""
+    codigo = f"import sys; sys.path.insert(0, {repo!r}); import servidor"
+    salida = subprocess.run([sys.executable, '-X', 'importtime', '-c', codigo],
+                            cwd=directorio, env=entorno(), capture_output=True, text=True)
+    modulos = []
+    for linea in salida.stderr.splitlines():
+        if not linea.startswith('import time:') or 'cumulative' in linea:
+            continue
+        _, acumulado, nombre = linea[len('import time:'):].split('|')
+        # Sangría de dos espacios: importado directamente por servidor.py
+        if nombre.startswith('   ') and not nombre.startswith('     '):
+            modulos.append((int(acumulado) / 1e6, nombre.strip()))
+    return sorted(modulos, reverse=True)[:cantidad]
+
+
+def resumen(valores):
+    valores = [v for v in valores if v is not None]
+    if not valores:
+        return None
+    return {
+        'mediana_s': round(statistics.median(valores), 4),
+        'min_s': round(min(valores), 4),
+        'max_s': round(max(valores), 4)
+    }
+
+
+def ejecutar(args):
+    repo = os.path.abspath(args.repo)
+    directorio = tempfile.mkdtemp(prefix='benchmark_arranque_')
+    try:
+        preparar_datos(directorio, args.registros)
+        # La primera ejecución compila los .pyc; no se cuenta
+        medir_importacion(repo, directorio)
+        importacion = [medir_importacion(repo, directorio) for _ in range(args.repeticiones)]
+        respuesta = [medir_primera_respuesta(repo, directorio) for _ in range(args.repeticiones)]
+        detalle = detalle_importacion(repo, directorio) if args.detalle else []
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'repo': repo,
+        'registros': args.registros,
+        'repeticiones': args.repeticiones,
+        'importacion': resumen(importacion),
+        'primera_respuesta': resumen(respuesta),
+        'detalle': detalle
+    }
+
+
+def mostrar(resultado):
+    print(f"🚀 Arranque de {resultado['repo']} con {resultado['registros']} registros "
+          f"({resultado['repeticiones']} repeticiones)")
+    print("-" * 60)
+    print(f"{'Medición':<20} | {'Mediana s':>10} | {'Mín s':>8} | {'Máx s':>8}")
+    print("-" * 60)
+    for nombre in ('importacion', 'primera_respuesta'):
+        r = resultado[nombre]
+        if r is None:
+            print(f"{nombre:<20} | {'sin respuesta':>10}")
+            continue
+        print(f"{nombre:<20} | {r['mediana_s']:>10} | {r['min_s']:>8} | {r['max_s']:>8}")
+    print("-" * 60)
+    if resultado['detalle']:
+        print("Módulos más lentos de importar:")
+        for segundos, nombre in resultado['detalle']:
+            print(f"  {segundos:>7.3f} s  {nombre}")
+
+
+def comparar(anterior, actual):
+    print(f"\n📊 Comparación con la ejecución del {anterior['fecha']}")
+    print("-" * 60)
+    for nombre in ('importacion', 'primera_respuesta'):
+        antes, ahora = anterior.get(nombre), actual.get(nombre)
+        if not antes or not ahora:
+            continue
+        cambio = (ahora['mediana_s'] - antes['mediana_s']) / antes['mediana_s'] * 100
+        print(f"{nombre:<20} {antes['mediana_s']:>8} s → {ahora['mediana_s']:>8} s "
+              f"({cambio:+.1f}%){'  ⚠️' if cambio > 10 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repo', default=os.path.dirname(os.path.abspath(__file__)),
+                        help='carpeta con servidor.py (defecto: esta)')
+    parser.add_argument('--registros', type=int, default=0,
+                        help='asistencias precargadas')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--detalle', action='store_true',
+                        help='mostrar los módulos más lentos de importar')
+    parser.add_argument('--salida', help='archivo JSON de resultados')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    mostrar(resultado)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados guardados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            comparar(json.load(f), resultado)
+
+
+if __name__ == '__main__':
+    main()
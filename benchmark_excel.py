@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la exportación a Excel: implementación clásica vs. modo write_only
+
+También mide los escritores CSV y JSON Lines de exportacion.FORMATOS como
+referencia. Genera registros de prueba y mide, para cada implementación, el tiempo de
+generación y la memoria máxima (RSS) del proceso. Cada medición se ejecuta en un
+proceso nuevo para que el pico de memoria de una no afecte a la otra.
+
+Uso:
+    python3 benchmark_excel.py                # 1000, 10000 y 50000 registros
+    python3 benchmark_excel.py 20000 100000   # tamaños personalizados
+
+Requiere un sistema tipo Unix (usa el módulo resource para medir el RSS).
+"""
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+TAMANOS_DEFECTO = [1000, 10000, 50000]
+
+
+def registros_de_prueba(cantidad):
+    for i in range(cantidad):
+        yield {
+            'apellido_paterno': f'APELLIDO{i}',
+            'apellido_materno': 'MATERNO',
+            'nombres': 'NOMBRE DE PRUEBA',
+            'dni': f'{i:08d}',
+            'cargo_numero_telefonico': '904076044',
+            'grupo_correo_electronico': f'PERSONA{i}@TRABAJO.GOB.PE',
+            'area_organizacional': 'Dirección General del Trabajo - DGT',
+            'centro_trabajo': 'SEDE CENTRAL',
+            'fecha_hora_servidor': '18/10/2026 10:00:00'
+        }
+
+
+def excel_clasico(registros):
+    """Implementación anterior de /api/descargar-excel (libro completo en memoria)"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Asistencias"
+
+    header_font = Font(bold=True, color="FFFFFF")
+    header_fill = PatternFill(start_color="1E56A0",
+                              end_color="1E56A0", fill_type="solid")
+    header_alignment = Alignment(horizontal="center", vertical="center")
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+    headers = ['APELLIDO PATERNO', 'APELLIDO MATERNO', 'NOMBRES', 'DNI', 'NÚMERO TELEFÓNICO',
+               'CORREO ELECTRÓNICO', 'ÁREA ORGANIZACIONAL', 'CENTRO DE TRABAJO', 'FECHA/HORA DE ASISTENCIA']
+
+    for col, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col, value=header)
+        cell.font = header_font
+        cell.fill = header_fill
+        cell.alignment = header_alignment
+        cell.border = border
+
+    for row, registro in enumerate(registros, 2):
+        datos = [
+            registro.get('apellido_paterno', ''),
+            registro.get('apellido_materno', ''),
+            registro.get('nombres', ''),
+            registro.get('dni', ''),
+            registro.get('cargo_numero_telefonico', ''),
+            registro.get('grupo_correo_electronico', ''),
+            registro.get('area_organizacional', ''),
+            registro.get('centro_trabajo', ''),
+            registro.get('fecha_hora_servidor', '')
+        ]
+        for col, valor in enumerate(datos, 1):
+            cell = ws.cell(row=row, column=col, value=valor)
+            cell.border = border
+            cell.alignment = Alignment(horizontal="left", vertical="center")
+
+    column_widths = [22, 22, 22, 12, 25, 30, 25, 25, 24]
+    for col, width in enumerate(column_widths, 1):
+        ws.column_dimensions[ws.cell(
+            row=1, column=col).column_letter].width = width
+
+    info_row = len(registros) + 3
+    ws.cell(row=info_row, column=1,
+            value="Total de registros:").font = Font(bold=True)
+    cell_total = ws.cell(row=info_row, column=2, value=len(registros))
+    cell_total.alignment = Alignment(horizontal="left")
+    ws.cell(row=info_row + 1, column=1,
+            value="Fecha de generación:").font = Font(bold=True)
+    cell_fecha = ws.cell(row=info_row + 1, column=2,
+                         value=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+    cell_fecha.alignment = Alignment(horizontal="left")
+
+    output = io.BytesIO()
+    wb.save(output)
+    output.seek(0)
+    return output.getvalue()
+
+
+def excel_streaming(registros):
+    """Implementación actual: libro write_only escrito en un archivo temporal"""
+    from exportacion import excel_temporal
+
+    archivo = excel_temporal(registros)
+    tamano = os.fstat(archivo.fileno()).st_size
+    archivo.close()
+    return tamano
+
+
+def exportar_formato(formato):
+    """Consume el escritor por trozos de un formato de exportacion.FORMATOS"""
+    def exportar(registros):
+        from exportacion import FORMATOS
+        return sum(len(trozo) for trozo in FORMATOS[formato].escritor(registros))
+    return exportar
+
+
+IMPLEMENTACIONES = {
+    'clasico': excel_clasico,
+    'streaming': excel_streaming,
+    'csv': exportar_formato('csv'),
+    'jsonl': exportar_formato('jsonl'),
+}
+
+
+def medir(nombre, cantidad):
+    """Se ejecuta en un proceso hijo: mide una implementación y escribe JSON"""
+    registros = list(registros_de_prueba(cantidad))
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    inicio = time.perf_counter()
+    IMPLEMENTACIONES[nombre](registros)
+    segundos = time.perf_counter() - inicio
+
+    rss_pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    print(json.dumps({
+        'segundos': segundos,
+        'rss_pico_mb': rss_pico / divisor,
+        'rss_extra_mb': (rss_pico - rss_base) / divisor
+    }))
+
+
+def ejecutar(nombre, cantidad):
+    salida = subprocess.run(
+        [sys.executable, __file__, '--medir', nombre, str(cantidad)],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(salida.stdout)
+
+
+def main(tamanos):
+    print("📊 Benchmark de exportación a Excel")
+    print("=" * 72)
+    print(f"{'Registros':>10} | {'Implementación':<14} | {'Tiempo (s)':>10} | "
+          f"{'RSS pico (MB)':>13} | {'RSS extra (MB)':>14}")
+    print("-" * 72)
+    for cantidad in tamanos:
+        for nombre in IMPLEMENTACIONES:
+            r = ejecutar(nombre, cantidad)
+            print(f"{cantidad:>10} | {nombre:<14} | {r['segundos']:>10.2f} | "
+                  f"{r['rss_pico_mb']:>13.1f} | {r['rss_extra_mb']:>14.1f}")
+        print("-" * 72)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--medir':
+        medir(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(n) for n in sys.argv[1:]] or TAMANOS_DEFECTO)
@@ -0,0 +1,359 @@
+"""
+Archivos estáticos (index.html, estilo.css, script.js) servidos desde memoria.
+
+Al iniciar, cada archivo se lee una sola vez, se minifica (el JS con rjsmin
+si está instalado) y se comprime con gzip y, si el módulo brotli está
+instalado, con brotli. El CSS y el JS se publican además con un nombre que
+incluye el hash de su contenido (estilo.3f2a1b9c0d.css), e index.html se
+reescribe para apuntar a esos nombres: el navegador puede guardarlos en
+caché para siempre porque un cambio produce un nombre nuevo.
+
+Solo se sirven los archivos registrados aquí; ningún otro archivo de la
+carpeta (datos de asistencia, configuración) es accesible desde la web.
+"""
+import copy
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+# Archivos que se publican con nombre con hash y caché inmutable
+ACTIVOS = ['estilo.css', 'script.js']
+
+# Página principal: se sirve siempre con revalidación (sin caché inmutable)
+PAGINA = 'index.html'
+
+# Cadenas y comentarios de CSS: las cadenas se conservan, los comentarios se quitan
+_TOKENS_CSS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*[\s\S]*?\*/)')
+
+
+def minificar_css(texto):
+    """Quita comentarios y espacios innecesarios sin tocar el contenido de las cadenas"""
+    partes = []
+    for indice, parte in enumerate(_TOKENS_CSS.split(texto)):
+        if indice % 2:
+            # Token separado: cadena (se conserva) o comentario (se descarta)
+            if not parte.startswith('/*'):
+                partes.append(parte)
+            continue
+        parte = re.sub(r'\s+', ' ', parte)
+        parte = re.sub(r'\s*([{};,>])\s*', r'\1', parte)
+        parte = re.sub(r':\s+', ':', parte)
+        partes.append(parte)
+    return ''.join(partes).replace(';}', '}').strip()
+
+
+# Signos junto a los que sobra un espacio (sin '/' ni '.': ver _separador_js)
+_SIGNOS_JS = frozenset('{}()[];,:=<>?&|!+-*%^~')
+# Después de estas palabras, '/' empieza una expresión regular y no una división
+_ANTES_DE_REGEX = frozenset(('return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void',
+                             'delete', 'throw', 'new', 'instanceof', 'yield', 'await'))
+_PALABRA_FINAL = re.compile(r'[A-Za-z_$][\w$]*$')
+
+
+def _separador_js(espacio, anterior, siguiente):
+    """Lo que queda de un espacio en blanco entre dos caracteres de código"""
+    if not espacio or not anterior:
+        return ''
+    if espacio == '\n':
+        # Aquí un salto de línea nunca termina una sentencia; los demás se
+        # conservan para no cambiar la inserción automática de punto y coma
+        if anterior in '{[(,;' or siguiente in '}])':
+            return ''
+        return '\n'
+    if anterior in _SIGNOS_JS or siguiente in _SIGNOS_JS:
+        # a + +b, a - -b y a < !--b cambiarían de significado sin el espacio
+        if anterior == siguiente and anterior in '+-' or (anterior, siguiente) == ('<', '!'):
+            return ' '
+        return ''
+    return ' '
+
+
+def _empieza_regex(previo):
+    """'/' empieza una expresión regular, y no una división, según el código anterior"""
+    if not previo:
+        return True
+    if previo[-1] in '"\'`)]}':
+        return False
+    palabra = _PALABRA_FINAL.search(previo)
+    if palabra is not None:
+        return palabra.group() in _ANTES_DE_REGEX
+    return not previo[-1].isdigit()
+
+
+def _fin_literal(texto, i, cierre):
+    """Posición siguiente al cierre de una cadena o expresión regular que empieza en i"""
+    clase = False
+    i += 1
+    while i < len(texto):
+        c = texto[i]
+        if c == '\\':
+            i += 2
+            continue
+        if cierre == '/' and c == '[':
+            clase = True
+        elif cierre == '/' and c == ']':
+            clase = False
+        elif c == cierre and not clase:
+            return i + 1
+        elif c == '\n' and cierre != '`':
+            # Literal sin cerrar: se deja el resto de la línea como está
+            return i
+        i += 1
+    return i
+
+
+def minificar_js_basico(texto):
+    """Quita comentarios, sangría, espacios y líneas vacías del JavaScript.
+
+    Las cadenas, plantillas y expresiones regulares se copian sin cambios.
+    Es más conservador que rjsmin: no une líneas que la inserción automática
+    de punto y coma podría separar.
+    """
+    salida = []
+    espacio = ''
+    # Llaves abiertas dentro de cada ${ ... } de plantilla en curso
+    llaves = []
+    en_plantilla = False
+    i, n = 0, len(texto)
+
+    def emitir(trozo):
+        nonlocal espacio
+        anterior = salida[-1][-1] if salida else ''
+        salida.append(_separador_js(espacio, anterior, trozo[0]) + trozo)
+        espacio = ''
+
+    while i < n:
+        if en_plantilla:
+            # Texto de una plantilla: hasta la comilla de cierre o el siguiente ${
+            inicio = i
+            while i < n and texto[i] != '`' and not texto.startswith('${', i):
+                i += 2 if texto[i] == '\\' else 1
+            if texto.startswith('${', i):
+                # La expresión interpolada se procesa como código
+                llaves.append(0)
+                i += 2
+            else:
+                i += 1
+            salida.append(texto[inicio:i])
+            en_plantilla = False
+            continue
+
+        c = texto[i]
+        if c in ' \t\r\n':
+            if c == '\n':
+                espacio = '\n'
+            elif not espacio:
+                espacio = ' '
+            i += 1
+        elif texto.startswith('//', i):
+            fin = texto.find('\n', i)
+            i = n if fin == -1 else fin
+        elif texto.startswith('/*', i):
+            fin = texto.find('*/', i + 2)
+            fin = n if fin == -1 else fin + 2
+            if '\n' in texto[i:fin]:
+                espacio = '\n'
+            elif not espacio:
+                espacio = ' '
+            i = fin
+        elif c in '"\'':
+            fin = _fin_literal(texto, i, c)
+            emitir(texto[i:fin])
+            i = fin
+        elif c == '`':
+            emitir('`')
+            i += 1
+            en_plantilla = True
+        elif c == '/':
+            if _empieza_regex(''.join(salida[-12:])):
+                fin = _fin_literal(texto, i, '/')
+                while fin < n and texto[fin].isalpha():
+                    fin += 1
+            else:
+                fin = i + 1
+            emitir(texto[i:fin])
+            i = fin
+        elif c == '{' and llaves:
+            llaves[-1] += 1
+            emitir(c)
+            i += 1
+        elif c == '}' and llaves:
+            if llaves[-1] == 0:
+                # Cierra el ${ ... }: sigue el texto de la plantilla
+                llaves.pop()
+                emitir(c)
+                en_plantilla = True
+            else:
+                llaves[-1] -= 1
+                emitir(c)
+            i += 1
+        else:
+            emitir(c)
+            i += 1
+    return ''.join(salida).strip() + '\n'
+
+
+def minificar_js(texto):
+    """Minifica con rjsmin si está instalado; si no, con minificar_js_basico"""
+    if rjsmin is None:
+        return minificar_js_basico(texto)
+    return rjsmin.jsmin(texto)
+
+
+# Bloques de la página cuyo contenido no se toca
+_BLOQUES_HTML = re.compile(r'(<(pre|textarea|script|style)\b[\s\S]*?</\2\s*>)', re.IGNORECASE)
+_COMENTARIO_HTML = re.compile(r'<!--(?!\[if)[\s\S]*?-->')
+# Etiquetas con sus atributos; los valores entre comillas se conservan
+_ETIQUETA_HTML = re.compile(r'(<(?:"[^"]*"|\'[^\']*\'|[^\'">])*>)')
+_VALOR_ATRIBUTO = re.compile(r'("[^"]*"|\'[^\']*\')')
+
+
+def _espacios_html(texto):
+    """Reduce cada grupo de espacios a un salto de línea o a un espacio"""
+    return re.sub(r'\s+', lambda m: '\n' if '\n' in m.group() else ' ', texto)
+
+
+def minificar_html(texto):
+    """Quita comentarios y sangría; el texto se ve igual porque el navegador
+    ya reduce los espacios (salvo en pre, textarea, script y style)"""
+    partes = []
+    for indice, parte in enumerate(_BLOQUES_HTML.split(texto)):
+        if indice % 3 == 1:
+            partes.append(parte)
+            continue
+        if indice % 3 == 2:
+            # Nombre de la etiqueta capturado por el grupo interno
+            continue
+        parte = _COMENTARIO_HTML.sub('', parte)
+        for posicion, trozo in enumerate(_ETIQUETA_HTML.split(parte)):
+            if posicion % 2 == 0:
+                partes.append(_espacios_html(trozo))
+                continue
+            partes.append(''.join(
+                valor if orden % 2 else _espacios_html(valor)
+                for orden, valor in enumerate(_VALOR_ATRIBUTO.split(trozo))))
+    return ''.join(partes).strip() + '\n'
+
+
+MINIFICADORES = {
+    '.css': minificar_css,
+    '.js': minificar_js,
+}
+
+
+def nombre_con_hash(nombre, huella):
+    base, extension = os.path.splitext(nombre)
+    return f"{base}.{huella}{extension}"
+
+
+def codificaciones_aceptadas(cabecera):
+    """Codificaciones de Accept-Encoding que el cliente acepta (q > 0)"""
+    aceptadas = set()
+    for parte in (cabecera or '').split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        calidad = parametros.strip()
+        if calidad.startswith('q='):
+            try:
+                if float(calidad[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nombre:
+            aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+class Recurso:
+    """Un archivo en memoria con sus variantes comprimidas"""
+
+    def __init__(self, nombre, contenido, inmutable):
+        self.nombre = nombre
+        self.mimetype = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+        self.inmutable = inmutable
+        self.huella = hashlib.sha256(contenido).hexdigest()[:10]
+        self.variantes = {'identity': contenido}
+
+        # Solo se guarda una variante comprimida si realmente ocupa menos
+        comprimido = gzip.compress(contenido, compresslevel=9, mtime=0)
+        if len(comprimido) < len(contenido):
+            self.variantes['gzip'] = comprimido
+        if brotli is not None:
+            comprimido = brotli.compress(contenido, quality=11)
+            if len(comprimido) < len(contenido):
+                self.variantes['br'] = comprimido
+
+    def variante(self, accept_encoding):
+        """Devuelve (codificación, contenido) según lo que acepta el cliente"""
+        aceptadas = codificaciones_aceptadas(accept_encoding)
+        for codificacion in ('br', 'gzip'):
+            if codificacion in self.variantes and codificacion in aceptadas:
+                return codificacion, self.variantes[codificacion]
+        return 'identity', self.variantes['identity']
+
+
+class RecursosEstaticos:
+    """Tabla en memoria de los archivos publicables, por nombre"""
+
+    def __init__(self, directorio='.', activos=ACTIVOS, pagina=PAGINA):
+        self.directorio = directorio
+        self.activos = list(activos)
+        self.pagina = pagina
+        self._recursos = {}
+        self._firmas = None
+        self.cargar()
+
+    def _ruta(self, nombre):
+        return os.path.join(self.directorio, nombre)
+
+    def _firma(self):
+        return [os.stat(self._ruta(nombre)).st_mtime_ns
+                for nombre in self.activos + [self.pagina]]
+
+    def cargar(self):
+        """Lee, minifica, comprime y publica todos los archivos"""
+        recursos = {}
+        nombres_con_hash = {}
+        for nombre in self.activos:
+            with open(self._ruta(nombre), 'r', encoding='utf-8') as f:
+                texto = f.read()
+            minificar = MINIFICADORES.get(os.path.splitext(nombre)[1])
+            if minificar is not None:
+                texto = minificar(texto)
+            recurso = Recurso(nombre, texto.encode('utf-8'), inmutable=True)
+            nombres_con_hash[nombre] = nombre_con_hash(nombre, recurso.huella)
+            recursos[nombres_con_hash[nombre]] = recurso
+            # Con su nombre original también (sin caché inmutable), para
+            # páginas guardadas antes de un cambio
+            original = copy.copy(recurso)
+            original.inmutable = False
+            recursos[nombre] = original
+
+        with open(self._ruta(self.pagina), 'r', encoding='utf-8') as f:
+            html = f.read()
+        for nombre, publicado in nombres_con_hash.items():
+            html = html.replace(f'"{nombre}"', f'"{publicado}"')
+        html = minificar_html(html)
+        recursos[self.pagina] = Recurso(self.pagina, html.encode('utf-8'), inmutable=False)
+
+        self._recursos = recursos
+        self._firmas = self._firma()
+
+    def recargar_si_cambio(self):
+        """Vuelve a cargar si algún archivo cambió (para el modo desarrollo)"""
+        if self._firma() != self._firmas:
+            self.cargar()
+
+    def buscar(self, nombre):
+        return self._recursos.get(nombre)
@@ -0,0 +1,94 @@
+"""
+Difusión de eventos a los navegadores mediante Server-Sent Events (SSE).
+
+Cada cliente conectado a /api/eventos tiene una suscripción que guarda solo el
+último valor de cada tipo de evento: si llegan cien registros seguidos, el
+cliente recibe un único evento con el total más reciente en lugar de cien.
+Si no hay eventos, cada cierto tiempo se compara el estado público con el
+último enviado (así se notan también los cambios hechos por otros workers) y
+se envía un comentario para mantener viva la conexión.
+"""
+import json
+import threading
+
+
+def formatear_evento(tipo, datos):
+    """Formatea un mensaje SSE"""
+    return f"event: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+class Suscripcion:
+    def __init__(self):
+        self.pendientes = {}
+        self.condicion = threading.Condition()
+
+    def entregar(self, tipo, datos):
+        with self.condicion:
+            self.pendientes[tipo] = datos
+            self.condicion.notify()
+
+    def esperar(self, tiempo_maximo):
+        """Espera eventos y los devuelve (lista vacía si se agotó el tiempo)"""
+        with self.condicion:
+            if not self.pendientes:
+                self.condicion.wait(tiempo_maximo)
+            eventos = list(self.pendientes.items())
+            self.pendientes = {}
+        return eventos
+
+
+class Difusor:
+    """Reparte eventos a todas las suscripciones abiertas"""
+
+    def __init__(self, max_clientes=100, intervalo_latido=15.0):
+        self.max_clientes = max_clientes
+        self.intervalo_latido = intervalo_latido
+        self._suscripciones = set()
+        self._cerrojo = threading.Lock()
+
+    @property
+    def clientes(self):
+        return len(self._suscripciones)
+
+    def suscribir(self):
+        """Crea una suscripción, o devuelve None si se alcanzó el máximo de clientes"""
+        with self._cerrojo:
+            if len(self._suscripciones) >= self.max_clientes:
+                return None
+            suscripcion = Suscripcion()
+            self._suscripciones.add(suscripcion)
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._cerrojo:
+            self._suscripciones.discard(suscripcion)
+
+    def publicar(self, tipo, datos):
+        with self._cerrojo:
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            suscripcion.entregar(tipo, datos)
+
+    def flujo(self, suscripcion, estado_publico):
+        """Generador del cuerpo de la respuesta SSE.
+
+        `estado_publico` devuelve el estado resumido que se envía al conectar y
+        cada vez que cambia sin que haya llegado un evento.
+        """
+        try:
+            ultimo = estado_publico()
+            yield formatear_evento('estado', ultimo)
+            while True:
+                eventos = suscripcion.esperar(self.intervalo_latido)
+                for tipo, datos in eventos:
+                    yield formatear_evento(tipo, datos)
+
+                actual = estado_publico()
+                if actual != ultimo and not eventos:
+                    yield formatear_evento('estado', actual)
+                elif not eventos:
+                    # Comentario SSE: mantiene la conexión abierta
+                    yield ": latido\n\n"
+                ultimo = actual
+        finally:
+            self.cancelar(suscripcion)
@@ -0,0 +1,325 @@
+"""
+Exportación de asistencias: Excel (.xlsx), CSV y JSON Lines.
+
+Todos los formatos usan el mismo esquema de columnas (COLUMNAS) y se registran
+en FORMATOS. Cada escritor es un generador que recibe un iterable de registros
+y produce el archivo por trozos (bytes), así la respuesta se envía mientras se
+genera y la memoria no depende del número de filas.
+
+openpyxl en modo write_only escribe cada fila directamente al archivo en lugar de
+mantener todas las celdas en memoria, y los estilos se registran una sola vez
+como estilos con nombre. Así el consumo de memoria no depende del número de
+registros y el archivo se puede enviar por partes desde un temporal. openpyxl
+se importa recién con el primer Excel: el servidor arranca sin cargarlo.
+
+CacheExcel conserva el último libro generado junto con la versión de los datos
+con que se construyó, para no regenerarlo mientras nada haya cambiado.
+"""
+import csv
+import io
+import json
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from metricas import sin_medicion
+
+MIMETYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Esquema común a todos los formatos: campo del registro, encabezado y ancho en Excel
+Columna = namedtuple('Columna', 'campo encabezado ancho')
+
+COLUMNAS = [
+    Columna('apellido_paterno', 'APELLIDO PATERNO', 22),
+    Columna('apellido_materno', 'APELLIDO MATERNO', 22),
+    Columna('nombres', 'NOMBRES', 22),
+    Columna('dni', 'DNI', 12),
+    Columna('cargo_numero_telefonico', 'NÚMERO TELEFÓNICO', 25),
+    Columna('grupo_correo_electronico', 'CORREO ELECTRÓNICO', 30),
+    Columna('area_organizacional', 'ÁREA ORGANIZACIONAL', 25),
+    Columna('centro_trabajo', 'CENTRO DE TRABAJO', 25),
+    Columna('fecha_hora_servidor', 'FECHA/HORA DE ASISTENCIA', 24),
+]
+
+ENCABEZADOS = [columna.encabezado for columna in COLUMNAS]
+CAMPOS = [columna.campo for columna in COLUMNAS]
+ANCHOS_COLUMNA = [columna.ancho for columna in COLUMNAS]
+
+# Tamaño aproximado de cada trozo que producen los escritores
+TAMANO_TROZO = 64 * 1024
+
+
+def _borde_fino():
+    from openpyxl.styles import Border, Side
+    return Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+
+
+def _registrar_estilos(wb):
+    """Registra los estilos con nombre una sola vez por libro"""
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+    wb.add_named_style(NamedStyle(
+        name='encabezado',
+        font=Font(bold=True, color="FFFFFF"),
+        fill=PatternFill(start_color="1E56A0",
+                         end_color="1E56A0", fill_type="solid"),
+        alignment=Alignment(horizontal="center", vertical="center"),
+        border=_borde_fino()
+    ))
+    wb.add_named_style(NamedStyle(
+        name='dato',
+        alignment=Alignment(horizontal="left", vertical="center"),
+        border=_borde_fino()
+    ))
+    wb.add_named_style(NamedStyle(name='etiqueta', font=Font(bold=True)))
+    wb.add_named_style(NamedStyle(
+        name='valor', alignment=Alignment(horizontal="left")))
+
+
+def _celda(ws, valor, estilo):
+    from openpyxl.cell import WriteOnlyCell
+    celda = WriteOnlyCell(ws, value=valor)
+    celda.style = estilo
+    return celda
+
+
+def escribir_excel(registros, destino):
+    """Escribe los registros como .xlsx en `destino` (ruta o archivo binario)"""
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    _registrar_estilos(wb)
+    ws = wb.create_sheet("Asistencias")
+
+    # Ajustar ancho de columnas (debe hacerse antes de escribir filas)
+    for col, ancho in enumerate(ANCHOS_COLUMNA, 1):
+        ws.column_dimensions[get_column_letter(col)].width = ancho
+
+    ws.append([_celda(ws, encabezado, 'encabezado')
+               for encabezado in ENCABEZADOS])
+
+    # Una celda con estilo por columna, reutilizada en cada fila: el modo
+    # write_only serializa la fila en cuanto se añade
+    celdas = [_celda(ws, None, 'dato') for _ in CAMPOS]
+    total = 0
+    for registro in registros:
+        for celda, campo in zip(celdas, CAMPOS):
+            celda.value = registro.get(campo, '')
+        ws.append(celdas)
+        total += 1
+
+    # Agregar información adicional
+    ws.append([])
+    ws.append([_celda(ws, "Total de registros:", 'etiqueta'),
+               _celda(ws, total, 'valor')])
+    ws.append([_celda(ws, "Fecha de generación:", 'etiqueta'),
+               _celda(ws, datetime.now().strftime('%d/%m/%Y %H:%M:%S'), 'valor')])
+
+    wb.save(destino)
+    return total
+
+
+def excel_temporal(registros):
+    """Genera el .xlsx en un archivo temporal y lo devuelve listo para leer.
+
+    El temporal se borra solo al cerrarse, por ejemplo cuando Flask termina de
+    enviarlo al cliente.
+    """
+    archivo = tempfile.TemporaryFile(suffix='.xlsx')
+    try:
+        escribir_excel(registros, archivo)
+    except BaseException:
+        archivo.close()
+        raise
+    archivo.seek(0)
+    return archivo
+
+
+def trozos_xlsx(registros):
+    """Escritor XLSX: genera el libro en un temporal y lo entrega por trozos.
+
+    El formato .xlsx es un ZIP y no puede emitirse fila a fila, pero el libro
+    se escribe en disco en modo write_only y nunca está completo en memoria.
+    """
+    archivo = excel_temporal(registros)
+    try:
+        while True:
+            trozo = archivo.read(TAMANO_TROZO)
+            if not trozo:
+                break
+            yield trozo
+    finally:
+        archivo.close()
+
+
+def _valor_csv(valor):
+    """Evita que Excel interprete como fórmula un texto que empieza con = + - @"""
+    if isinstance(valor, str) and valor[:1] in ('=', '+', '-', '@'):
+        return "'" + valor
+    return valor
+
+
+def trozos_csv(registros):
+    """Escritor CSV en UTF-8 con BOM (así Excel reconoce las tildes y la ñ)"""
+    bufer = io.StringIO()
+    escritor = csv.writer(bufer)
+    bufer.write('\ufeff')
+    escritor.writerow(ENCABEZADOS)
+    for registro in registros:
+        escritor.writerow([_valor_csv(registro.get(campo, '')) for campo in CAMPOS])
+        if bufer.tell() >= TAMANO_TROZO:
+            yield bufer.getvalue().encode('utf-8')
+            bufer.seek(0)
+            bufer.truncate()
+    yield bufer.getvalue().encode('utf-8')
+
+
+def trozos_jsonl(registros):
+    """Escritor JSON Lines: un objeto por registro con los campos del esquema"""
+    lineas = []
+    tamano = 0
+    for registro in registros:
+        linea = json.dumps({campo: registro.get(campo, '') for campo in CAMPOS},
+                           ensure_ascii=False) + '\n'
+        lineas.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_TROZO:
+            yield ''.join(lineas).encode('utf-8')
+            lineas = []
+            tamano = 0
+    yield ''.join(lineas).encode('utf-8')
+
+
+class FormatoExportacion:
+    """Formato de exportación: extensión, tipo MIME y escritor por trozos"""
+
+    def __init__(self, extension, mimetype, escritor):
+        self.extension = extension
+        self.mimetype = mimetype
+        self.escritor = escritor
+
+
+FORMATOS = {}
+
+
+def registrar_formato(nombre, extension, mimetype, escritor):
+    FORMATOS[nombre] = FormatoExportacion(extension, mimetype, escritor)
+
+
+registrar_formato('xlsx', 'xlsx', MIMETYPE_XLSX, trozos_xlsx)
+# Flask añade charset=utf-8 a los tipos text/*
+registrar_formato('csv', 'csv', 'text/csv', trozos_csv)
+registrar_formato('jsonl', 'jsonl', 'application/x-ndjson; charset=utf-8', trozos_jsonl)
+
+
+def recorrer_registros(registros_desde, pagina=1000):
+    """Recorre los registros por páginas de seq en lugar de copiarlos todos.
+
+    `registros_desde(desde, limite)` es el método del almacenamiento que
+    devuelve (registros, último seq).
+    """
+    desde = 0
+    while True:
+        registros, ultimo_seq = registros_desde(desde, pagina)
+        yield from registros
+        if not registros or registros[-1]['seq'] >= ultimo_seq:
+            return
+        desde = registros[-1]['seq']
+
+
+class CopiaExcel:
+    """Libro ya generado junto con la versión de los datos que contiene"""
+
+    def __init__(self, version, contenido, fecha, total):
+        self.version = version
+        self.contenido = contenido
+        self.fecha = fecha
+        self.total = total
+
+
+class CacheExcel:
+    """Último .xlsx generado, reconstruido en segundo plano cuando cambian los datos.
+
+    `version` devuelve el sello actual de los datos sin copiarlos e `instantanea`
+    devuelve (versión, registros) de forma consistente. Tras cada invalidación
+    se espera `espera` segundos sin cambios antes de reconstruir, para no
+    regenerar el libro en cada registro durante la llegada masiva; mientras
+    nadie haya descargado el libro no se reconstruye en segundo plano.
+    `cronometro` mide la construcción del libro (ver metricas.py).
+    """
+
+    def __init__(self, version, instantanea, espera=5.0, cronometro=sin_medicion):
+        self._version = version
+        self._instantanea = instantanea
+        self.espera = espera
+        self._cronometro = cronometro
+        self._copia = None
+        self._cerrojo_construccion = threading.Lock()
+        self._evento = threading.Event()
+        self._ultimo_cambio = 0.0
+        self._hilo = None
+        self._cerrojo_hilo = threading.Lock()
+        # Ya se pidió una descarga: desde entonces se reconstruye por adelantado
+        self._solicitada = False
+
+    def obtener(self):
+        """Devuelve la copia vigente, construyéndola si los datos cambiaron"""
+        self._solicitada = True
+        return self._construir()
+
+    def _construir(self):
+        copia = self._copia
+        if copia is not None and copia.version == self._version():
+            return copia
+
+        # Si otro hilo ya está construyendo, esperar y reutilizar su resultado
+        with self._cerrojo_construccion:
+            version, registros = self._instantanea()
+            copia = self._copia
+            if copia is not None and copia.version == version:
+                return copia
+            if not registros:
+                self._copia = None
+                return None
+
+            salida = io.BytesIO()
+            fecha = datetime.now()
+            with self._cronometro('excel'):
+                total = escribir_excel(registros, salida)
+            self._copia = CopiaExcel(version, salida.getvalue(), fecha, total)
+            return self._copia
+
+    def invalidar(self):
+        """Marca los datos como cambiados y programa la reconstrucción"""
+        if not self._solicitada:
+            # Sin descargas no hace falta el libro: obtener() lo construirá
+            return
+        self._ultimo_cambio = time.monotonic()
+        with self._cerrojo_hilo:
+            if self._hilo is None:
+                self._hilo = threading.Thread(
+                    target=self._bucle_reconstruccion, name='cache-excel', daemon=True)
+                self._hilo.start()
+        self._evento.set()
+
+    def _bucle_reconstruccion(self):
+        while True:
+            self._evento.wait()
+            self._evento.clear()
+            # Esperar a que los registros dejen de llegar
+            while True:
+                restante = self._ultimo_cambio + self.espera - time.monotonic()
+                if restante <= 0:
+                    break
+                time.sleep(restante)
+            try:
+                self._construir()
+            except Exception as e:
+                print(f"⚠️  No se pudo reconstruir el Excel en segundo plano: {e}")
@@ -0,0 +1,171 @@
+"""
+Exportaciones en segundo plano.
+
+POST /api/exportaciones encola la exportación y responde en el acto con el id
+del trabajo; un grupo acotado de hilos escribe el archivo mientras el panel
+consulta el avance (filas escritas) y lo descarga al terminar. Así una
+exportación grande no ocupa el hilo de una petición que necesitan los
+participantes para registrarse.
+
+El estado de cada trabajo se guarda junto a su archivo en `directorio`
+(<id>.json y <id>.<extensión>), de modo que cualquier worker de gunicorn
+puede informar el avance y servir la descarga. Los archivos se conservan
+`ttl` segundos desde su última actualización y luego se borran.
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Cada cuántas filas se publica el avance de un trabajo
+INTERVALO_AVANCE = 1000
+
+_PATRON_ID = re.compile(r'[0-9a-f]{16}')
+
+
+class ColaExportaciones:
+    """Trabajos de exportación con avance y archivos compartidos en disco"""
+
+    def __init__(self, formatos, directorio='exportaciones', hilos=1, max_pendientes=4,
+                 ttl=600.0):
+        self.formatos = formatos
+        self.directorio = directorio
+        self.max_pendientes = max_pendientes
+        self.ttl = ttl
+        self._hilos = hilos
+        self._ejecutor = None
+        self._pendientes = 0
+        self._cerrojo = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+
+        # Los hilos del grupo no pasan a los workers creados con fork
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        self._ejecutor = None
+        self._pendientes = 0
+        self._cerrojo = threading.Lock()
+
+    # --- Archivos del trabajo ---
+
+    def _ruta(self, id_trabajo, extension):
+        return os.path.join(self.directorio, f'{id_trabajo}.{extension}')
+
+    def _guardar(self, trabajo):
+        """Reemplaza el estado del trabajo de forma atómica"""
+        temporal = self._ruta(trabajo['id'], 'json.tmp')
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(trabajo, f, ensure_ascii=False)
+        os.replace(temporal, self._ruta(trabajo['id'], 'json'))
+
+    def estado(self, id_trabajo):
+        """Estado del trabajo (de cualquier worker), o None si no existe o venció"""
+        if not _PATRON_ID.fullmatch(id_trabajo or ''):
+            return None
+        try:
+            with open(self._ruta(id_trabajo, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def archivo(self, trabajo):
+        """Ruta del archivo terminado de un trabajo"""
+        return self._ruta(trabajo['id'], self.formatos[trabajo['formato']].extension)
+
+    # --- Ejecución ---
+
+    def encolar(self, formato, registros, total, nombre):
+        """Encola la exportación; devuelve el estado inicial, o None si la cola está llena.
+
+        `registros` se recorre en el hilo del trabajo (puede ser un generador
+        que lee el almacenamiento por páginas) y `total` es el número esperado
+        de filas, para mostrar el porcentaje.
+        """
+        self.limpiar_vencidos()
+        with self._cerrojo:
+            if self._pendientes >= self.max_pendientes:
+                return None
+            self._pendientes += 1
+            if self._ejecutor is None:
+                self._ejecutor = ThreadPoolExecutor(
+                    max_workers=self._hilos, thread_name_prefix='exportacion')
+
+        trabajo = {
+            "id": secrets.token_hex(8),
+            "formato": formato,
+            "nombre": f'{nombre}.{self.formatos[formato].extension}',
+            "estado": 'en_cola',
+            "filas": 0,
+            "total": total,
+            "error": None,
+            "creado": datetime.now().isoformat()
+        }
+        self._guardar(trabajo)
+        inicial = dict(trabajo)
+        self._ejecutor.submit(self._ejecutar, trabajo, registros)
+        return inicial
+
+    def _contar(self, trabajo, registros):
+        """Pasa los registros al escritor publicando el avance cada tanto"""
+        for registro in registros:
+            yield registro
+            trabajo['filas'] += 1
+            if trabajo['filas'] % INTERVALO_AVANCE == 0:
+                self._guardar(trabajo)
+
+    def _ejecutar(self, trabajo, registros):
+        ruta = self.archivo(trabajo)
+        try:
+            trabajo['estado'] = 'en_curso'
+            self._guardar(trabajo)
+            escritor = self.formatos[trabajo['formato']].escritor
+            with open(ruta + '.tmp', 'wb') as f:
+                for trozo in escritor(self._contar(trabajo, registros)):
+                    f.write(trozo)
+            os.replace(ruta + '.tmp', ruta)
+            trabajo['estado'] = 'listo'
+        except Exception as e:
+            print(f"⚠️  Falló la exportación {trabajo['id']}: {e}")
+            trabajo['estado'] = 'error'
+            trabajo['error'] = str(e)
+            _borrar(ruta + '.tmp')
+        finally:
+            trabajo['terminado'] = datetime.now().isoformat()
+            self._guardar(trabajo)
+            with self._cerrojo:
+                self._pendientes -= 1
+            # Borrar el archivo al vencer aunque nadie vuelva a exportar
+            limpieza = threading.Timer(self.ttl + 1, self.limpiar_vencidos)
+            limpieza.daemon = True
+            limpieza.start()
+
+    # --- Limpieza ---
+
+    def limpiar_vencidos(self):
+        """Borra los trabajos sin cambios en los últimos `ttl` segundos"""
+        limite = time.time() - self.ttl
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        for nombre in nombres:
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                vencido = os.path.getmtime(ruta) < limite
+            except OSError:
+                continue
+            if vencido and _PATRON_ID.fullmatch(nombre.split('.', 1)[0]):
+                _borrar(ruta)
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except OSError:
+        # En Windows no se puede borrar un archivo que se está descargando
+        pass
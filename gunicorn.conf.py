@@ -0,0 +1,48 @@
+"""
+Configuración de gunicorn para el formulario de asistencia.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Los valores se pueden ajustar con variables de entorno (WORKERS, HILOS, PUERTO).
+Cada conexión SSE (/api/eventos) ocupa un hilo de su worker mientras está
+abierta; por defecto cada worker acepta como máximo la mitad de sus hilos en
+conexiones SSE y el resto de clientes vuelve al sondeo de /api/estado.
+
+El almacenamiento es el mismo que con servidor.py (ALMACENAMIENTO en .env).
+Con JSON Lines y varios workers la escritura diferida se desactiva para que
+ningún worker compruebe duplicados sin ver los registros que otro aún no
+escribió; con SQLite cada registro ya se confirma en una transacción
+compartida por todos los procesos.
+"""
+import multiprocessing
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+# Las variables de .env tienen prioridad sobre los valores por defecto de aquí
+load_dotenv()
+
+bind = f"0.0.0.0:{os.getenv('PUERTO', '8080')}"
+workers = int(os.getenv('WORKERS', min(4, multiprocessing.cpu_count())))
+worker_class = 'gthread'
+threads = int(os.getenv('HILOS', '16'))
+graceful_timeout = 10
+keepalive = 5
+
+# Los workers importan la aplicación después de leer esta configuración
+if workers > 1 and os.getenv('ALMACENAMIENTO', 'jsonl') == 'jsonl':
+    os.environ['VOLCADO_INTERVALO'] = '0'
+# Cada conexión SSE ocupa un hilo: reservar la mitad para las demás peticiones
+eventos_max_clientes = min(int(os.getenv('EVENTOS_MAX_CLIENTES', str(threads))),
+                           max(1, threads // 2))
+os.environ['EVENTOS_MAX_CLIENTES'] = str(eventos_max_clientes)
+# Con todos los hilos ocupados (descontadas las conexiones SSE abiertas) las
+# peticiones reciben 503 en lugar de esperar en cola
+os.environ.setdefault('MAX_CONCURRENCIA', str(threads))
+
+
+def on_starting(server):
+    """Al arrancar, la sesión de administrador de la ejecución anterior deja de valer"""
+    # Los workers heredan la variable (ver INICIO_SERVIDOR en servidor.py)
+    os.environ['INICIO_SERVIDOR'] = datetime.now().isoformat()
@@ -0,0 +1,111 @@
+"""
+Límites de peticiones por IP y de peticiones simultáneas.
+
+LimitadorPeticiones aplica una cubeta de fichas por (endpoint, IP): cada
+petición gasta una ficha y las fichas se reponen a `por_minuto` por minuto
+hasta un máximo de `rafaga`. Sin fichas se responde 429 con Retry-After. La
+tabla de cubetas está acotada (LRU): al llenarse se descarta la IP que lleva
+más tiempo sin pedir nada, así un barrido de IPs no agota la memoria.
+
+LimiteConcurrencia acota las peticiones atendidas a la vez; las que superan
+el máximo reciben 503 en el acto en lugar de esperar en cola.
+
+Con varios workers (gunicorn) cada proceso lleva sus propias cuentas.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Peticiones por minuto sostenidas y ráfaga máxima
+Limite = namedtuple('Limite', 'por_minuto rafaga')
+
+
+class LimitadorPeticiones:
+    """Cubetas de fichas por endpoint e IP, con tabla LRU acotada"""
+
+    def __init__(self, limites, max_claves=10000):
+        self.limites = dict(limites)
+        self.max_claves = max_claves
+        self._cubetas = OrderedDict()
+        self._cerrojo = threading.Lock()
+        self.permitidas = {}
+        self.rechazadas = {}
+        self.descartadas = 0
+
+    def consumir(self, endpoint, ip):
+        """Gasta una ficha; devuelve 0 si se permite o los segundos a esperar"""
+        limite = self.limites.get(endpoint)
+        if limite is None:
+            return 0
+        tasa = limite.por_minuto / 60
+        clave = (endpoint, ip)
+        ahora = time.monotonic()
+        with self._cerrojo:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self._cubetas[clave] = [float(limite.rafaga), ahora]
+                if len(self._cubetas) > self.max_claves:
+                    self._cubetas.popitem(last=False)
+                    self.descartadas += 1
+            else:
+                self._cubetas.move_to_end(clave)
+                cubeta[0] = min(limite.rafaga, cubeta[0] + (ahora - cubeta[1]) * tasa)
+                cubeta[1] = ahora
+
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                self.permitidas[endpoint] = self.permitidas.get(endpoint, 0) + 1
+                return 0
+            self.rechazadas[endpoint] = self.rechazadas.get(endpoint, 0) + 1
+            return (1 - cubeta[0]) / tasa
+
+    def estadisticas(self):
+        with self._cerrojo:
+            return {
+                "claves": len(self._cubetas),
+                "max_claves": self.max_claves,
+                "descartadas": self.descartadas,
+                "permitidas": dict(self.permitidas),
+                "rechazadas": dict(self.rechazadas)
+            }
+
+
+class LimiteConcurrencia:
+    """Cuenta las peticiones en curso y rechaza las que superan el máximo.
+
+    `ocupados` devuelve los lugares que otras conexiones usan en ese momento
+    (p. ej. las conexiones SSE abiertas) y se descuentan del máximo.
+    """
+
+    def __init__(self, maximo, ocupados=None):
+        self.maximo = maximo
+        self.ocupados = ocupados
+        self.en_curso = 0
+        self.rechazadas = 0
+        self._cerrojo = threading.Lock()
+
+    def limite(self):
+        """Peticiones que se atienden a la vez ahora mismo (0: sin límite)"""
+        if not self.maximo or self.ocupados is None:
+            return self.maximo
+        return max(1, self.maximo - self.ocupados())
+
+    def entrar(self):
+        """True si la petición puede atenderse (luego hay que llamar a salir)"""
+        limite = self.limite()
+        with self._cerrojo:
+            if limite and self.en_curso >= limite:
+                self.rechazadas += 1
+                return False
+            self.en_curso += 1
+            return True
+
+    def salir(self):
+        with self._cerrojo:
+            self.en_curso -= 1
+
+
+def segundos_reintento(espera):
+    """Valor de la cabecera Retry-After (segundos enteros, al menos 1)"""
+    return str(max(1, math.ceil(espera)))
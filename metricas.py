@@ -0,0 +1,127 @@
+"""
+Métricas del servidor en formato de texto de Prometheus.
+
+Contadores, histogramas y medidores en memoria, pensados para dejarlos siempre
+activos: registrar una observación es una búsqueda binaria en las cubetas y
+una suma bajo un cerrojo. Los medidores (registros guardados, tamaño de los
+archivos de datos) se calculan solo cuando se consulta /api/metricas.
+
+Con varios workers (gunicorn) cada proceso tiene sus propias métricas; la
+etiqueta `pid` de cada serie indica de qué worker vienen.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+PREFIJO = 'asistencia'
+
+# Límites superiores de las cubetas de los histogramas, en segundos
+CUBETAS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Flask agrega `charset=utf-8` a los tipos text/*
+MIMETYPE_PROMETHEUS = 'text/plain; version=0.0.4'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ''
+    return '{' + ','.join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + '}'
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    """Registro de métricas de un proceso"""
+
+    def __init__(self, prefijo=PREFIJO, cubetas=CUBETAS):
+        self.prefijo = prefijo
+        self.cubetas = cubetas
+        self._cerrojo = threading.Lock()
+        # nombre -> (tipo, ayuda, series o función); series: etiquetas -> valor
+        self._metricas = {}
+
+    def contador(self, nombre, ayuda):
+        self._metricas[nombre] = ('counter', ayuda, {})
+
+    def histograma(self, nombre, ayuda):
+        self._metricas[nombre] = ('histogram', ayuda, {})
+
+    def medidor(self, nombre, ayuda, funcion):
+        """Medidor calculado al consultar: `funcion` devuelve un número o un
+        diccionario {(('etiqueta', 'valor'), ...): número}"""
+        self._metricas[nombre] = ('gauge', ayuda, funcion)
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        series = self._metricas[nombre][2]
+        clave = tuple(sorted(etiquetas.items()))
+        with self._cerrojo:
+            series[clave] = series.get(clave, 0) + valor
+
+    def observar(self, nombre, segundos, **etiquetas):
+        series = self._metricas[nombre][2]
+        clave = tuple(sorted(etiquetas.items()))
+        indice = bisect.bisect_left(self.cubetas, segundos)
+        with self._cerrojo:
+            serie = series.get(clave)
+            if serie is None:
+                # Conteo por cubeta (la última es +Inf), suma y cuenta
+                serie = series[clave] = [[0] * (len(self.cubetas) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += segundos
+            serie[2] += 1
+
+    @contextmanager
+    def cronometro(self, operacion):
+        """Mide la duración de una operación interna (histograma operacion_segundos)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar('operacion_segundos', time.perf_counter() - inicio,
+                          operacion=operacion)
+
+    def formatear(self):
+        """Todas las métricas en formato de exposición de texto de Prometheus"""
+        pid = ('pid', os.getpid())
+        lineas = []
+        for nombre, (tipo, ayuda, series) in self._metricas.items():
+            completo = f'{self.prefijo}_{nombre}'
+            lineas.append(f'# HELP {completo} {ayuda}')
+            lineas.append(f'# TYPE {completo} {tipo}')
+
+            if tipo == 'gauge':
+                valor = series()
+                valores = valor if isinstance(valor, dict) else {(): valor}
+                for clave, numero in valores.items():
+                    lineas.append(f'{completo}{_etiquetas(clave + (pid,))} {_numero(numero)}')
+                continue
+
+            with self._cerrojo:
+                copia = {clave: (list(serie[0]), serie[1], serie[2]) if tipo == 'histogram'
+                         else serie for clave, serie in series.items()}
+            for clave, serie in sorted(copia.items()):
+                if tipo == 'counter':
+                    lineas.append(f'{completo}{_etiquetas(clave + (pid,))} {_numero(serie)}')
+                    continue
+                conteos, suma, cuenta = serie
+                acumulado = 0
+                for limite, conteo in zip(self.cubetas + ('+Inf',), conteos):
+                    acumulado += conteo
+                    etiquetas = _etiquetas(clave + (pid, ('le', limite)))
+                    lineas.append(f'{completo}_bucket{etiquetas} {acumulado}')
+                lineas.append(f'{completo}_sum{_etiquetas(clave + (pid,))} {_numero(suma)}')
+                lineas.append(f'{completo}_count{_etiquetas(clave + (pid,))} {cuenta}')
+        return '\n'.join(lineas) + '\n'
+
+
+def sin_medicion(operacion):
+    """Cronómetro vacío para los componentes creados sin registro de métricas"""
+    return nullcontext()
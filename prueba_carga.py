@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga y benchmark de la API de asistencia
+
+Simula una sesión real contra un servidor ya iniciado:
+  - N participantes registrando su asistencia a la vez (/api/registrar)
+  - M navegadores consultando el estado (/api/estado)
+  - un administrador descargando el Excel periódicamente (/api/descargar-excel)
+
+Muestra latencias p50/p95/p99, peticiones por segundo y errores por endpoint, y
+compara los registros enviados con los que quedaron guardados para detectar
+pérdidas. El resultado se guarda en JSON para comparar ejecuciones posteriores.
+
+Uso (con el servidor ya iniciado):
+    python3 prueba_carga.py --total 2000 --concurrencia 50 --sondeadores 100
+    python3 prueba_carga.py --comparar resultado_carga_20261018_103000.json
+
+Para comparar los modos de ejecución, repetir la prueba con:
+    python3 servidor.py                          # desarrollo (Werkzeug + depurador)
+    python3 servidor.py --produccion --hilos 32  # waitress multihilo
+    gunicorn -c gunicorn.conf.py wsgi:app        # varios procesos (Linux/macOS)
+
+Usar con POLITICA_DUPLICADOS=rechazar (defecto): cada registro lleva un DNI
+distinto, así que cualquier 409 indica un problema.
+"""
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+
+class Cliente:
+    """Conexión HTTP persistente que mide la latencia de cada petición"""
+
+    def __init__(self, url):
+        destino = urlparse(url)
+        self.host = destino.hostname
+        self.puerto = destino.port or 80
+        self.conexion = http.client.HTTPConnection(
+            self.host, self.puerto, timeout=60)
+
+    def pedir(self, metodo, ruta, datos=None, cabeceras=None):
+        """Devuelve (estado, cuerpo en bytes, segundos)"""
+        cabeceras = dict(cabeceras or {})
+        cuerpo = None
+        if datos is not None:
+            cuerpo = json.dumps(datos)
+            cabeceras['Content-Type'] = 'application/json'
+        for intento in range(2):
+            inicio = time.perf_counter()
+            try:
+                self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+                respuesta = self.conexion.getresponse()
+                contenido = respuesta.read()
+                return respuesta.status, contenido, time.perf_counter() - inicio
+            except (http.client.HTTPException, OSError) as e:
+                # Reabrir la conexión si el servidor la cerró
+                self.conexion.close()
+                self.conexion = http.client.HTTPConnection(
+                    self.host, self.puerto, timeout=60)
+                # Una conexión inactiva cerrada por el servidor (keep-alive
+                # vencido) se reintenta una vez; otros fallos cuentan como error
+                cerrada = isinstance(e, (http.client.RemoteDisconnected,
+                                         BrokenPipeError, ConnectionResetError))
+                if intento or not cerrada:
+                    return 'conexion', b'', time.perf_counter() - inicio
+
+    def post(self, ruta, datos):
+        estado, contenido, _ = self.pedir('POST', ruta, datos)
+        return estado, json.loads(contenido or b'{}')
+
+    def cerrar(self):
+        self.conexion.close()
+
+
+class Medicion:
+    """Latencias y errores de un endpoint"""
+
+    def __init__(self):
+        self.latencias = []
+        self.errores = {}
+        self._cerrojo = threading.Lock()
+
+    def anotar(self, estado, segundos, esperado=(200,)):
+        with self._cerrojo:
+            if estado in esperado:
+                self.latencias.append(segundos)
+            else:
+                self.errores[str(estado)] = self.errores.get(str(estado), 0) + 1
+
+    def resumen(self, duracion):
+        latencias = sorted(self.latencias)
+
+        def percentil(p):
+            if not latencias:
+                return None
+            indice = min(len(latencias) - 1, int(round(p / 100 * (len(latencias) - 1))))
+            return round(latencias[indice] * 1000, 2)
+
+        return {
+            'peticiones': len(latencias) + sum(self.errores.values()),
+            'correctas': len(latencias),
+            'errores': self.errores,
+            'por_segundo': round(len(latencias) / duracion, 1) if duracion else None,
+            'p50_ms': percentil(50),
+            'p95_ms': percentil(95),
+            'p99_ms': percentil(99),
+            'max_ms': round(latencias[-1] * 1000, 2) if latencias else None
+        }
+
+
+def registro_de_prueba(numero, base, marca):
+    return {
+        'apellido_paterno': f'CARGA{numero}',
+        'apellido_materno': 'PRUEBA',
+        'nombres': 'PARTICIPANTE',
+        'dni': f'{(base + numero) % 100000000:08d}',
+        'cargo_numero_telefonico': '900000000',
+        'grupo_correo_electronico': f'CARGA{numero}@PRUEBA.PE',
+        'area_organizacional': 'Dirección General del Trabajo - DGT',
+        'centro_trabajo': marca
+    }
+
+
+def contar_guardados(admin, token, marca, desde_seq):
+    """Cuenta los registros de esta ejecución leyendo /api/registros por páginas"""
+    guardados = 0
+    desde = desde_seq
+    while True:
+        estado, contenido, _ = admin.pedir(
+            'GET', f'/api/registros?desde={desde}&limite=5000',
+            cabeceras={'X-Admin-Token': token})
+        if estado != 200:
+            return None
+        datos = json.loads(contenido)
+        guardados += sum(1 for r in datos['registros']
+                         if r.get('centro_trabajo') == marca)
+        desde = datos['desde']
+        if not datos['hay_mas']:
+            return guardados
+
+
+def ultimo_seq(admin, token):
+    seq = 0
+    while True:
+        estado, contenido, _ = admin.pedir(
+            'GET', f'/api/registros?desde={seq}&limite=5000',
+            cabeceras={'X-Admin-Token': token})
+        if estado != 200:
+            return 0
+        datos = json.loads(contenido)
+        seq = datos['desde']
+        if not datos['hay_mas']:
+            return seq
+
+
+def ejecutar(args):
+    admin = Cliente(args.url)
+    estado, respuesta = admin.post(
+        '/api/login', {'usuario': args.usuario, 'clave': args.clave})
+    if estado != 200:
+        print(f"❌ No se pudo iniciar sesión: {respuesta.get('error')}")
+        return None
+    token = respuesta['admin_token']
+    admin.post('/api/iniciar', {'admin_token': token, 'minutos': 30})
+    seq_inicial = ultimo_seq(admin, token)
+
+    # DNI distintos en cada ejecución para no chocar con pruebas anteriores
+    base = int(time.time() * 1000) % 100000000
+    marca = f'PRUEBA DE CARGA {base}'
+    siguiente = iter(range(args.total))
+    cerrojo = threading.Lock()
+    terminado = threading.Event()
+    mediciones = {
+        'registrar': Medicion(),
+        'estado': Medicion(),
+        'descargar_excel': Medicion()
+    }
+
+    def participante():
+        cliente = Cliente(args.url)
+        while True:
+            with cerrojo:
+                numero = next(siguiente, None)
+            if numero is None:
+                break
+            estado, _, segundos = cliente.pedir(
+                'POST', '/api/registrar', registro_de_prueba(numero, base, marca))
+            mediciones['registrar'].anotar(estado, segundos)
+        cliente.cerrar()
+
+    def sondeador():
+        cliente = Cliente(args.url)
+        while not terminado.is_set():
+            estado, _, segundos = cliente.pedir('GET', '/api/estado')
+            mediciones['estado'].anotar(estado, segundos)
+            terminado.wait(args.intervalo_sondeo)
+        cliente.cerrar()
+
+    def descargador():
+        cliente = Cliente(args.url)
+        while not terminado.is_set():
+            estado, _, segundos = cliente.pedir('GET', '/api/descargar-excel',
+                                                cabeceras={'X-Admin-Token': token})
+            # 404 = todavía no hay registros
+            mediciones['descargar_excel'].anotar(estado, segundos, esperado=(200, 404))
+            terminado.wait(args.intervalo_excel)
+        cliente.cerrar()
+
+    print(f"🚀 {args.total} registros con {args.concurrencia} participantes, "
+          f"{args.sondeadores} sondeadores y {'1' if args.intervalo_excel > 0 else '0'} "
+          f"descargador de Excel contra {args.url}")
+    participantes = [threading.Thread(target=participante)
+                     for _ in range(args.concurrencia)]
+    fondo = [threading.Thread(target=sondeador) for _ in range(args.sondeadores)]
+    if args.intervalo_excel > 0:
+        fondo.append(threading.Thread(target=descargador))
+
+    inicio = time.perf_counter()
+    for hilo in fondo + participantes:
+        hilo.start()
+    for hilo in participantes:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    terminado.set()
+    for hilo in fondo:
+        hilo.join()
+
+    # Dar tiempo a la escritura diferida antes de contar lo guardado
+    time.sleep(args.espera_volcado)
+    guardados = contar_guardados(admin, token, marca, seq_inicial)
+    admin.post('/api/cerrar-sesion', {'token': token})
+    admin.cerrar()
+
+    enviados = len(mediciones['registrar'].latencias)
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'url': args.url,
+        'parametros': {
+            'total': args.total,
+            'concurrencia': args.concurrencia,
+            'sondeadores': args.sondeadores,
+            'intervalo_sondeo': args.intervalo_sondeo,
+            'intervalo_excel': args.intervalo_excel
+        },
+        'duracion_s': round(duracion, 3),
+        'endpoints': {nombre: medicion.resumen(duracion)
+                      for nombre, medicion in mediciones.items()},
+        'registros': {
+            'enviados_ok': enviados,
+            'guardados': guardados,
+            'perdidos': None if guardados is None else enviados - guardados
+        }
+    }
+
+
+def mostrar(resultado):
+    print("-" * 78)
+    print(f"{'Endpoint':<16} | {'Correctas':>9} | {'Errores':>7} | {'pet/s':>7} | "
+          f"{'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    print("-" * 78)
+    for nombre, r in resultado['endpoints'].items():
+        errores = sum(r['errores'].values())
+        print(f"{nombre:<16} | {r['correctas']:>9} | {errores:>7} | "
+              f"{r['por_segundo'] or 0:>7} | {r['p50_ms'] or '-':>7} | "
+              f"{r['p95_ms'] or '-':>7} | {r['p99_ms'] or '-':>7}")
+        if errores:
+            print(f"{'':<16}   códigos de error: {r['errores']}")
+    print("-" * 78)
+    if any('429' in r['errores'] for r in resultado['endpoints'].values()):
+        print("⚠️  El servidor limitó las peticiones (429): inícialo con LIMITES_PETICIONES=0")
+    if any('503' in r['errores'] for r in resultado['endpoints'].values()):
+        print("⚠️  El servidor rechazó peticiones por sobrecarga (503): "
+              "revisa MAX_CONCURRENCIA y --hilos")
+    registros = resultado['registros']
+    print(f"⏱️  Duración: {resultado['duracion_s']} s")
+    print(f"📨 Registros aceptados: {registros['enviados_ok']}  "
+          f"💾 Guardados: {registros['guardados']}")
+    if registros['perdidos']:
+        print(f"🚨 ¡Se perdieron {registros['perdidos']} registros!")
+    elif registros['perdidos'] == 0:
+        print("✅ Ningún registro perdido")
+
+
+def comparar(anterior, actual):
+    """Muestra la variación de cada métrica respecto a una ejecución anterior"""
+    print(f"\n📊 Comparación con la ejecución del {anterior['fecha']}")
+    print("-" * 60)
+    for nombre, r in actual['endpoints'].items():
+        previo = anterior['endpoints'].get(nombre)
+        if not previo:
+            continue
+        for metrica in ('por_segundo', 'p50_ms', 'p95_ms', 'p99_ms'):
+            antes, ahora = previo.get(metrica), r.get(metrica)
+            if not antes or ahora is None:
+                continue
+            cambio = (ahora - antes) / antes * 100
+            # Más peticiones por segundo es mejor; más latencia es peor
+            peor = cambio < -10 if metrica == 'por_segundo' else cambio > 10
+            print(f"{nombre:<16} {metrica:<12} {antes:>9} → {ahora:>9} "
+                  f"({cambio:+.1f}%){'  ⚠️' if peor else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://localhost:8080')
+    parser.add_argument('--total', type=int, default=1000,
+                        help='registros a enviar')
+    parser.add_argument('--concurrencia', type=int, default=50,
+                        help='participantes simultáneos (hilos)')
+    parser.add_argument('--sondeadores', type=int, default=20,
+                        help='navegadores consultando /api/estado')
+    parser.add_argument('--intervalo-sondeo', type=float, default=1.0,
+                        help='segundos entre consultas de cada sondeador')
+    parser.add_argument('--intervalo-excel', type=float, default=2.0,
+                        help='segundos entre descargas del Excel (0 = sin descargas)')
+    parser.add_argument('--espera-volcado', type=float, default=1.5,
+                        help='segundos de espera antes de contar los registros guardados')
+    parser.add_argument('--salida', help='archivo JSON de resultados '
+                        '(defecto: resultado_carga_<fecha>.json)')
+    parser.add_argument('--comparar', help='JSON de una ejecución anterior')
+    parser.add_argument('--usuario', default=os.getenv('ADMIN_USUARIO', 'admin'))
+    parser.add_argument('--clave', default=os.getenv('ADMIN_CLAVE', 'usst2025'))
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    if resultado is None:
+        return
+    mostrar(resultado)
+
+    salida = args.salida or f"resultado_carga_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"💾 Resultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            comparar(json.load(f), resultado)
+
+
+if __name__ == '__main__':
+    main()
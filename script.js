@@ -2,15 +2,22 @@
 // Las credenciales ahora se validan en el servidor por seguridad
 const MAX_INTENTOS_FALLIDOS = 3;
 const BLOQUEO_MINUTOS = 10;
+const COLA_ASISTENCIAS = 'cola_asistencias'; // Asistencias pendientes de envío (localStorage)
+const LOTE_MAXIMO = 50; // Asistencias por petición a /api/registrar-lote
+const REINTENTO_COLA_MS = 15000;
+const SONDEO_EXPORTACION_MS = 500; // Consulta del avance de una exportación
 
 // --- Variables globales ---
-let registros_acumulados = [];
 let tiempo_restante_segundos = 0;
 let admin_logueado = false;
 let admin_token = null; // Token de sesión del admin
 let intentos_fallidos = 0;
 let bloqueo_hasta = null;
 let temporizador_local = null;
+let fuente_eventos = null; // Conexión SSE con /api/eventos
+let intervalo_sondeo = null; // Sondeo de respaldo cuando SSE no está disponible
+let envio_cola = null; // Envío de la cola en curso (una sola a la vez)
+let exportacion_en_curso = false;
 
 // --- Funciones para persistir el bloqueo ---
 function guardar_estado_bloqueo() {
@@ -323,36 +330,101 @@ async function login_admin_servidor(usuario, clave) {
     }
 }
 
+function actualizar_contador(total) {
+    const contador = document.getElementById('contador_valor');
+    if (contador) contador.textContent = total;
+}
+
+function sincronizar_temporizador(tiempo) {
+    // Solo iniciar temporizador local si ha cambiado significativamente
+    if (Math.abs(tiempo_restante_segundos - tiempo) > 2 || tiempo_restante_segundos === 0) {
+        if (tiempo > 0) {
+            iniciar_temporizador_local(tiempo);
+        } else {
+            actualizar_temporizador_ui(0);
+        }
+    }
+}
+
 async function cargar_estado_servidor() {
     try {
         const res = await fetch('/api/estado');
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
         const estado = await res.json();
 
-        // Actualizar registros acumulados
-        registros_acumulados = estado.registros || [];
-
         // Actualizar contador
-        const contador = document.getElementById('contador_valor');
-        if (contador) contador.textContent = registros_acumulados.length;
+        actualizar_contador(estado.total || 0);
 
         // Actualizar temporizador
-        const tiempo = estado.tiempo_restante || 0;
-
-        // Solo iniciar temporizador local si ha cambiado significativamente
-        if (Math.abs(tiempo_restante_segundos - tiempo) > 2 || tiempo_restante_segundos === 0) {
-            if (tiempo > 0) {
-                iniciar_temporizador_local(tiempo);
-            } else {
-                actualizar_temporizador_ui(0);
-            }
-        }
+        sincronizar_temporizador(estado.tiempo_restante || 0);
 
     } catch (e) {
         console.warn('No se pudo cargar estado:', e.message);
     }
 }
 
+// --- Eventos en tiempo real (SSE) con sondeo como respaldo ---
+function iniciar_sondeo() {
+    if (!intervalo_sondeo) {
+        intervalo_sondeo = setInterval(cargar_estado_servidor, 10000); // Cada 10 segundos
+    }
+}
+
+function detener_sondeo() {
+    if (intervalo_sondeo) {
+        clearInterval(intervalo_sondeo);
+        intervalo_sondeo = null;
+    }
+}
+
+function conectar_eventos() {
+    if (!window.EventSource) {
+        iniciar_sondeo();
+        return;
+    }
+
+    fuente_eventos = new EventSource('/api/eventos');
+
+    fuente_eventos.addEventListener('open', () => {
+        detener_sondeo();
+    });
+
+    // Estado completo al conectar o cuando cambia en otro worker
+    fuente_eventos.addEventListener('estado', e => {
+        const estado = JSON.parse(e.data);
+        actualizar_contador(estado.total);
+        sincronizar_temporizador(estado.tiempo_restante);
+    });
+
+    fuente_eventos.addEventListener('temporizador', e => {
+        const datos = JSON.parse(e.data);
+        // 'cerrar': el servidor avisa que venció el plazo
+        if (datos.accion === 'detener' || datos.accion === 'cerrar') {
+            if (temporizador_local) {
+                clearInterval(temporizador_local);
+                temporizador_local = null;
+            }
+            actualizar_temporizador_ui(0);
+        } else {
+            iniciar_temporizador_local(datos.tiempo_restante);
+        }
+    });
+
+    fuente_eventos.addEventListener('registros', e => {
+        actualizar_contador(JSON.parse(e.data).total);
+    });
+
+    fuente_eventos.addEventListener('error', () => {
+        // Mientras no haya conexión se vuelve al sondeo periódico
+        iniciar_sondeo();
+        if (fuente_eventos.readyState === EventSource.CLOSED) {
+            // El servidor rechazó la conexión (p. ej. demasiados clientes): reintentar más tarde
+            fuente_eventos = null;
+            setTimeout(conectar_eventos, 30000);
+        }
+    });
+}
+
 async function iniciar_temporizador_servidor(minutos) {
     try {
         const res = await fetch('/api/iniciar', {
@@ -432,27 +504,194 @@ async function detener_temporizador_servidor() {
     }
 }
 
+// --- Cola de asistencias sin conexión ---
+// Cada asistencia se guarda primero en localStorage con un id_cliente único y
+// se envía en lotes a /api/registrar-lote. Si el envío falla queda en la cola
+// y se reintenta; el servidor ignora los id_cliente que ya guardó.
+function generar_id_cliente() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function leer_cola() {
+    try {
+        return JSON.parse(localStorage.getItem(COLA_ASISTENCIAS)) || [];
+    } catch (e) {
+        return [];
+    }
+}
+
+function guardar_cola(cola) {
+    if (cola.length > 0) {
+        localStorage.setItem(COLA_ASISTENCIAS, JSON.stringify(cola));
+    } else {
+        localStorage.removeItem(COLA_ASISTENCIAS);
+    }
+}
+
+async function vaciar_cola() {
+    const resultados = {};
+    let tamano_lote = LOTE_MAXIMO;
+    try {
+        let cola = leer_cola();
+        while (cola.length > 0) {
+            const lote = cola.slice(0, tamano_lote);
+            const res = await fetch('/api/registrar-lote', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                // 'enviado' permite al servidor corregir el desfase del reloj de este dispositivo
+                body: JSON.stringify({ registros: lote, enviado: Date.now() })
+            });
+
+            if (res.status === 413 && lote.length > 1) {
+                // El servidor admite lotes más pequeños: dividir sin quitar nada de la cola
+                tamano_lote = Math.ceil(lote.length / 2);
+                continue;
+            }
+
+            if (res.ok) {
+                const datos = await res.json();
+                datos.resultados.forEach(r => { resultados[r.id_cliente] = r; });
+                if (datos.total !== undefined) actualizar_contador(datos.total);
+            } else if (res.status === 400 || res.status === 413) {
+                // Petición mal formada o un solo registro demasiado grande: reintentar no sirve
+                const error = await res.json();
+                lote.forEach(r => { resultados[r.id_cliente] = { ok: false, error: error.error }; });
+            } else {
+                if (res.status === 429 || res.status === 503) {
+                    // Servidor ocupado o demasiados intentos: queda en la cola
+                    lote.forEach(r => { resultados[r.id_cliente] = { ok: false, ocupado: true }; });
+                }
+                break; // Error del servidor: se reintenta más tarde
+            }
+
+            // Otra pestaña pudo añadir asistencias mientras tanto: quitar solo las enviadas
+            const enviados = new Set(lote.map(r => r.id_cliente));
+            cola = leer_cola().filter(r => !enviados.has(r.id_cliente));
+            guardar_cola(cola);
+        }
+    } catch (e) {
+        // Sin conexión: la cola se conserva para el siguiente intento
+    }
+    return resultados;
+}
+
+function enviar_cola() {
+    if (!envio_cola) {
+        envio_cola = vaciar_cola().finally(() => { envio_cola = null; });
+    }
+    return envio_cola;
+}
+
+async function reintentar_cola() {
+    const pendientes = leer_cola().length;
+    if (pendientes === 0) return;
+    const resultados = Object.values(await enviar_cola());
+    const enviados = resultados.filter(r => r.ok).length;
+    // Rechazadas por el servidor (formulario cerrado al capturarlas, datos inválidos)
+    const rechazadas = resultados.filter(r => !r.ok && !r.ocupado);
+    if (rechazadas.length > 0) {
+        mostrar_mensaje(`⚠️ ${rechazadas.length} asistencia(s) guardadas sin conexión no se aceptaron: ${rechazadas[0].error || 'error al registrar'}.`, 'advertencia');
+    } else if (enviados > 0) {
+        mostrar_mensaje(`✅ Se enviaron ${enviados} asistencia(s) guardadas sin conexión.`, 'exito');
+    }
+}
+
 async function registrar_asistencia_servidor(datos) {
+    datos.id_cliente = generar_id_cliente();
+    // Hora de captura: si llega después del cierre, el servidor la acepta
+    // siempre que se haya guardado con la sesión abierta
+    datos.capturado = Date.now();
+    guardar_cola([...leer_cola(), datos]);
+
+    let resultado = (await enviar_cola())[datos.id_cliente];
+    if (!resultado && leer_cola().some(r => r.id_cliente === datos.id_cliente)) {
+        // Se añadió cuando otro envío ya terminaba: intentar de nuevo
+        resultado = (await enviar_cola())[datos.id_cliente];
+    }
+
+    if (!resultado) {
+        mostrar_mensaje('📶 Sin conexión. Tu asistencia quedó guardada en este dispositivo y se enviará automáticamente.', 'advertencia');
+        return 'pendiente';
+    }
+    if (resultado.ok) {
+        return true;
+    }
+    if (resultado.ocupado) {
+        mostrar_mensaje('⏳ El servidor está ocupado. Tu asistencia quedó guardada en este dispositivo y se enviará automáticamente.', 'advertencia');
+        return 'pendiente';
+    }
+    if (resultado.estado === 'duplicado') {
+        // El servidor ya tiene este DNI registrado
+        mostrar_mensaje('⚠️ Este DNI ya está registrado.', 'advertencia');
+    } else {
+        mostrar_mensaje(`❌ ${resultado.error || 'Error al registrar asistencia.'}`, 'error');
+    }
+    return false;
+}
+
+// --- Exportaciones en segundo plano ---
+// El servidor genera el archivo en un hilo aparte; aquí se consulta el avance
+// (filas escritas) para mostrar la barra y al terminar se descarga el archivo.
+function mostrar_avance_exportacion(texto, porcentaje) {
+    const contenedor = document.getElementById('avance_exportacion');
+    if (!contenedor) return;
+    if (porcentaje === null) {
+        contenedor.hidden = true;
+        return;
+    }
+    contenedor.hidden = false;
+    document.getElementById('barra_exportacion').style.width = `${porcentaje}%`;
+    document.getElementById('texto_exportacion').textContent = texto;
+}
+
+async function exportar_en_segundo_plano(formato) {
+    if (exportacion_en_curso) {
+        mostrar_mensaje('⏳ Ya hay una exportación en curso.', 'advertencia');
+        return;
+    }
+    exportacion_en_curso = true;
+    const nombre_formato = formato.toUpperCase();
+
     try {
-        const res = await fetch('/api/registrar', {
+        const res = await fetch('/api/exportaciones', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(datos)
+            body: JSON.stringify({ admin_token: admin_token, formato: formato })
         });
-
-        if (res.ok) {
-            return true;
-        } else if (res.status === 400) {
-            const error = await res.json();
-            mostrar_mensaje(`❌ ${error.error}`, 'error');
-            return false;
-        } else {
-            mostrar_mensaje('❌ Error al registrar asistencia.', 'error');
-            return false;
+        let trabajo = await res.json();
+        if (res.status === 404) {
+            mostrar_mensaje('⚠️ No hay registros para descargar.', 'advertencia');
+            return;
         }
+        if (!res.ok) throw new Error(trabajo.error);
+
+        const url = `/api/exportaciones/${trabajo.id}`;
+        const token = `token=${encodeURIComponent(admin_token)}`;
+        while (trabajo.estado === 'en_cola' || trabajo.estado === 'en_curso') {
+            const porcentaje = trabajo.total ? Math.min(100, Math.round(trabajo.filas * 100 / trabajo.total)) : 0;
+            mostrar_avance_exportacion(
+                `Generando ${nombre_formato}: ${trabajo.filas} de ${trabajo.total} filas`, porcentaje);
+            await new Promise(resolve => setTimeout(resolve, SONDEO_EXPORTACION_MS));
+
+            const estado = await fetch(`${url}?${token}`);
+            trabajo = await estado.json();
+            if (!estado.ok) throw new Error(trabajo.error);
+        }
+        if (trabajo.estado !== 'listo') throw new Error(trabajo.error || 'La exportación falló');
+
+        mostrar_avance_exportacion(`${nombre_formato} listo: ${trabajo.filas} filas`, 100);
+        const link = document.createElement('a');
+        link.href = `${url}/archivo?${token}`;
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        mostrar_mensaje(`✅ ${nombre_formato} descargado correctamente.`, 'exito');
     } catch (e) {
-        mostrar_mensaje('❌ Error de conexión al registrar.', 'error');
-        return false;
+        mostrar_mensaje(`❌ Error al exportar ${nombre_formato}: ${e.message}`, 'error');
+    } finally {
+        exportacion_en_curso = false;
+        setTimeout(() => mostrar_avance_exportacion('', null), 3000);
     }
 }
 
@@ -516,11 +755,16 @@ document.addEventListener('DOMContentLoaded', async () => {
     // ✅ 0.2. Inicializar estado del formulario (bloqueado por defecto)
     controlar_estado_formulario(false);
 
-    // ✅ 1. Sincronización con servidor (menos frecuente para evitar conflictos)
+    // ✅ 1. Sincronización con servidor: eventos en tiempo real, sondeo solo como respaldo
     await cargar_estado_servidor();
-    setInterval(cargar_estado_servidor, 10000); // Cada 10 segundos en lugar de 2
+    conectar_eventos();
 
-    // ✅ 1.1. Verificación periódica de sesión de administrador
+    // ✅ 1.1. Enviar las asistencias que quedaron guardadas sin conexión
+    reintentar_cola();
+    window.addEventListener('online', reintentar_cola);
+    setInterval(reintentar_cola, REINTENTO_COLA_MS);
+
+    // ✅ 1.2. Verificación periódica de sesión de administrador
     setInterval(async () => {
         if (admin_logueado && admin_token) {
             const sesionValida = await verificar_sesion_servidor();
@@ -724,8 +968,7 @@ document.addEventListener('DOMContentLoaded', async () => {
             cargo_numero_telefonico: document.getElementById('cargo_numero_telefonico').value.trim(),
             grupo_correo_electronico: document.getElementById('grupo_correo_electronico').value.trim(),
             area_organizacional: areaOrganizacionalTexto,
-            centro_trabajo: document.getElementById('centro_trabajo').value.trim(),
-            fecha_hora: formatear_fecha_hora(new Date())
+            centro_trabajo: document.getElementById('centro_trabajo').value.trim()
         };
 
         // Validaciones
@@ -740,16 +983,14 @@ document.addEventListener('DOMContentLoaded', async () => {
             return;
         }
 
-        // Verificar si ya está registrado
-        if (registros_acumulados.some(r => r.dni === datos.dni)) {
-            mostrar_mensaje('⚠️ Este DNI ya está registrado.', 'advertencia');
-            return;
-        }
+        // Los DNI duplicados los detecta el servidor (respuesta 409)
 
-        // Enviar al servidor
+        // Enviar al servidor (o guardar en la cola si no hay conexión)
         const exito = await registrar_asistencia_servidor(datos);
         if (exito) {
-            mostrar_mensaje('✅ Asistencia registrada correctamente.', 'exito');
+            if (exito === true) {
+                mostrar_mensaje('✅ Asistencia registrada correctamente.', 'exito');
+            }
 
             // Limpiar formulario
             document.getElementById('formulario_asistencia').reset();
@@ -760,32 +1001,21 @@ document.addEventListener('DOMContentLoaded', async () => {
     });
 
 
-    // Descarga Excel
-    document.getElementById('btn_descargar_excel')?.addEventListener('click', async () => {
-        if (admin_logueado) {
-            try {
-                // Obtener registros actualizados del servidor
-                await cargar_estado_servidor();
-
-                if (registros_acumulados.length > 0) {
-                    // Descargar directamente desde el servidor
-                    const link = document.createElement('a');
-                    link.href = '/api/descargar-excel';
-                    link.download = `asistencias_${new Date().toISOString().slice(0, 10)}.xlsx`;
-                    document.body.appendChild(link);
-                    link.click();
-                    document.body.removeChild(link);
+    // Descargas: el archivo se genera en segundo plano mostrando el avance
+    document.getElementById('btn_descargar_excel')?.addEventListener('click', () => {
+        if (!admin_logueado) {
+            mostrar_mensaje('❌ Debes estar logueado como administrador.', 'error');
+            return;
+        }
+        exportar_en_segundo_plano('xlsx');
+    });
 
-                    mostrar_mensaje('✅ Excel descargado correctamente.', 'exito');
-                } else {
-                    mostrar_mensaje('⚠️ No hay registros para descargar.', 'advertencia');
-                }
-            } catch (e) {
-                mostrar_mensaje('❌ Error al generar Excel.', 'error');
-            }
-        } else {
+    document.getElementById('btn_descargar_csv')?.addEventListener('click', () => {
+        if (!admin_logueado) {
             mostrar_mensaje('❌ Debes estar logueado como administrador.', 'error');
+            return;
         }
+        exportar_en_segundo_plano('csv');
     });
 
     document.getElementById('btn_cerrar_sesion')?.addEventListener('click', async () => {
@@ -1,14 +1,29 @@
-from flask import Flask, jsonify, request, send_from_directory, make_response
-import json
+from flask import Flask, Response, g, jsonify, request, send_file, stream_with_context
+import argparse
+import atexit
 import logging
 import os
+import signal
 import socket
-from datetime import datetime
+import sys
+from datetime import datetime, timedelta
 import hashlib
+import hmac
 import io
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+import time
 from dotenv import load_dotenv
+from almacenamiento import TIPOS_ALMACENAMIENTO, AlmacenRegistros
+from exportacion import FORMATOS, MIMETYPE_XLSX, CacheExcel, recorrer_registros
+from exportaciones import ColaExportaciones
+from eventos import Difusor
+from estaticos import RecursosEstaticos
+from limites import Limite, LimiteConcurrencia, LimitadorPeticiones, segundos_reintento
+from metricas import MIMETYPE_PROMETHEUS, Metricas
+from temporizador import Temporizador
+from validacion import ESQUEMA_LOTE, ESQUEMA_REGISTRO, primer_error
+
+# Inicio de la configuración del servidor (después de importar los módulos)
+_inicio_arranque = time.perf_counter()
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -17,27 +32,41 @@ load_dotenv()
 ADMIN_USUARIO = os.getenv('ADMIN_USUARIO', 'admin')  # Valor por defecto si no existe
 ADMIN_CLAVE = os.getenv('ADMIN_CLAVE', 'usst2025')  # Valor por defecto si no existe
 ADMIN_CLAVE_HASH = hashlib.sha256(ADMIN_CLAVE.encode()).hexdigest()
+# Token fijo opcional para que Prometheus lea /api/metricas sin iniciar sesión
+METRICAS_TOKEN = os.getenv('METRICAS_TOKEN', '')
 
-# Variable global para manejar sesión única
-admin_sesion_activa = {
+# Sesión única de administrador. Se guarda en los metadatos del almacenamiento
+# para que todos los workers compartan la misma sesión.
+SESION_ADMIN_VACIA = {
     "token": None,
     "timestamp": None,
     "ip": None
 }
+# Horas que dura una sesión de administrador desde el login
+SESION_ADMIN_HORAS = float(os.getenv('SESION_ADMIN_HORAS', '12'))
+# Arranque del servidor fijado por el proceso maestro de gunicorn (gunicorn.conf.py):
+# las sesiones abiertas antes de un reinicio dejan de valer en todos los workers
+INICIO_SERVIDOR = os.getenv('INICIO_SERVIDOR')
 
 
 def obtener_ip_local():
-    """Obtiene la IP LAN de la máquina (ej: 192.168.1.87)"""
+    """Obtiene la IP LAN de la máquina (ej: 192.168.1.87)
+
+    No depende de la red: conectar un socket UDP no envía tráfico, solo elige
+    la interfaz de salida. Se usa una dirección privada para que funcione
+    también en redes sin salida a internet, y no se consulta el DNS.
+    """
+    if os.getenv('IP_LOCAL'):
+        return os.getenv('IP_LOCAL')
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
-        # Método 1: Conexión simulada a una IP externa (no se envía tráfico)
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        s.connect(("8.8.8.8", 80))  # Google DNS
-        ip = s.getsockname()[0]
+        s.connect(("10.255.255.255", 1))
+        return s.getsockname()[0]
+    except OSError:
+        # Sin ninguna interfaz de red activa
+        return '127.0.0.1'
+    finally:
         s.close()
-        return ip
-    except:
-        # Método 2: Fallback (puede devolver 127.0.0.1)
-        return socket.gethostbyname(socket.gethostname())
 
 
 # ✅ Desactivar logs HTTP innecesarios
@@ -45,37 +74,240 @@ log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
 app = Flask(__name__)
-ESTADO_ARCHIVO = 'estado.json'
-
-
-def cargar_estado():
-    if os.path.exists(ESTADO_ARCHIVO):
-        with open(ESTADO_ARCHIVO, 'r', encoding='utf-8') as f:
-            estado = json.load(f)
-            # Calcular tiempo restante real basado en el tiempo transcurrido
-            if estado.get('ultimo_inicio'):
-                try:
-                    inicio = datetime.fromisoformat(estado['ultimo_inicio'])
-                    ahora = datetime.now()
-                    transcurrido = int((ahora - inicio).total_seconds())
-                    tiempo_inicial = estado.get('tiempo_inicial', 0)
-                    tiempo_restante = max(0, tiempo_inicial - transcurrido)
-                    estado['tiempo_restante'] = tiempo_restante
-                except:
-                    estado['tiempo_restante'] = 0
-            return estado
-    return {
-        "tiempo_restante": 0,
-        "tiempo_inicial": 0,
-        "registros": [],
-        "admin_logueado": False,
-        "ultimo_inicio": None
-    }
+# Tamaño máximo del cuerpo de una petición (un lote completo ocupa mucho menos)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENIDO', str(256 * 1024)))
+ESTADO_ARCHIVO = 'estado.json'  # Formato anterior, se migra automáticamente
+REGISTROS_ARCHIVO = os.getenv('REGISTROS_ARCHIVO', 'registros.jsonl')
+META_ARCHIVO = os.getenv('META_ARCHIVO', 'estado_meta.json')
+SQLITE_ARCHIVO = os.getenv('SQLITE_ARCHIVO', 'asistencias.db')
+ALMACENAMIENTO = os.getenv('ALMACENAMIENTO', 'jsonl')
+
+
+def crear_almacen(tipo):
+    """Crea el almacenamiento elegido; ambos ofrecen la misma interfaz"""
+    if tipo not in TIPOS_ALMACENAMIENTO:
+        raise ValueError(
+            f"Almacenamiento inválido: {tipo} (usa {', '.join(TIPOS_ALMACENAMIENTO)})")
+    comunes = dict(
+        archivo_registros=REGISTROS_ARCHIVO,
+        archivo_meta=META_ARCHIVO,
+        archivo_legado=ESTADO_ARCHIVO,
+        politica_fsync=os.getenv('FSYNC_POLITICA', 'intervalo'),
+        politica_duplicados=os.getenv('POLITICA_DUPLICADOS', 'rechazar'),
+        indexar_correo=os.getenv('DUPLICADOS_POR_CORREO', '0') == '1'
+    )
+    if tipo == 'sqlite':
+        # Historial de sesiones en una base SQLite (migra los datos JSON Lines)
+        from almacenamiento_sqlite import AlmacenSQLite
+        return AlmacenSQLite(archivo=SQLITE_ARCHIVO, **comunes)
+
+    if os.path.exists(SQLITE_ARCHIVO):
+        # La migración es de JSON Lines a SQLite y una sola vez: no al revés
+        print(f"⚠️  Existe {SQLITE_ARCHIVO} pero ALMACENAMIENTO=jsonl: "
+              "sus registros no se usan (fija ALMACENAMIENTO=sqlite en .env)")
+
+    # Registro de asistencias de solo anexado (una línea JSON por asistencia)
+    return AlmacenRegistros(
+        fsync_intervalo=float(os.getenv('FSYNC_INTERVALO', '1.0')),
+        volcado_intervalo=float(os.getenv('VOLCADO_INTERVALO', '0.5')),
+        volcado_max_pendientes=int(os.getenv('VOLCADO_MAX_PENDIENTES', '50')),
+        **comunes
+    )
+
+
+# Tiempo de carga del almacenamiento (registros e índices), informado en /readyz
+_inicio_carga = time.perf_counter()
+almacen = crear_almacen(ALMACENAMIENTO)
+TIEMPO_CARGA = time.perf_counter() - _inicio_carga
+
+# Métricas de peticiones y operaciones internas (ver /api/metricas)
+metricas = Metricas()
+
+# Máximo de asistencias por petición a /api/registrar-lote
+LOTE_MAXIMO = int(os.getenv('LOTE_MAXIMO', '100'))
+# Segundos tras el cierre en los que aún se aceptan asistencias guardadas sin conexión
+GRACIA_LOTE_SEGUNDOS = float(os.getenv('GRACIA_LOTE_SEGUNDOS', '120'))
+
+# Último Excel generado; se reconstruye en segundo plano cuando cambian los datos
+cache_excel = CacheExcel(
+    almacen.version,
+    almacen.instantanea,
+    espera=float(os.getenv('EXCEL_ESPERA_RECONSTRUCCION', '5')),
+    cronometro=metricas.cronometro
+)
+
+# Exportaciones en segundo plano con avance (/api/exportaciones)
+exportaciones = ColaExportaciones(
+    FORMATOS,
+    directorio=os.getenv('EXPORTACIONES_DIR', 'exportaciones'),
+    hilos=int(os.getenv('EXPORTACIONES_HILOS', '1')),
+    max_pendientes=int(os.getenv('EXPORTACIONES_MAX_PENDIENTES', '4')),
+    ttl=float(os.getenv('EXPORTACIONES_TTL', '600'))
+)
+
+# index.html, estilo.css y script.js minificados y comprimidos en memoria
+recursos = RecursosEstaticos(os.path.dirname(os.path.abspath(__file__)))
+
+# Peticiones por minuto y ráfaga por IP en los endpoints públicos
+LIMITES_ENDPOINT = {
+    '/api/login': Limite(por_minuto=10, rafaga=5),
+    '/api/verificar-sesion': Limite(por_minuto=30, rafaga=10),
+    '/api/registrar': Limite(por_minuto=20, rafaga=10),
+    '/api/registrar-lote': Limite(por_minuto=20, rafaga=10),
+    '/api/estado': Limite(por_minuto=60, rafaga=20),
+    '/api/eventos': Limite(por_minuto=30, rafaga=10),
+}
+limitador = LimitadorPeticiones(
+    LIMITES_ENDPOINT if os.getenv('LIMITES_PETICIONES', '1') == '1' else {},
+    max_claves=int(os.getenv('LIMITES_MAX_IPS', '10000'))
+)
+
+# Canal SSE que reemplaza el sondeo periódico de /api/estado
+difusor = Difusor(max_clientes=int(os.getenv('EVENTOS_MAX_CLIENTES', '100')))
+
+# Peticiones atendidas a la vez (0: sin límite; en producción, los hilos). Cada
+# conexión SSE abierta ocupa un hilo y se descuenta del máximo.
+concurrencia = LimiteConcurrencia(int(os.getenv('MAX_CONCURRENCIA', '0')),
+                                  ocupados=lambda: difusor.clientes)
+
+# Sin límite de concurrencia: SSE (conexiones largas), archivos en memoria y
+# métricas (para poder observar una sobrecarga)
+SIN_LIMITE_CONCURRENCIA = {'eventos', 'index', 'archivos_estaticos', 'exponer_metricas',
+                           'healthz', 'readyz'}
+
+
+def tamano_archivos():
+    """Tamaño en bytes de cada archivo de datos del almacenamiento"""
+    tamanos = {}
+    for archivo in almacen.archivos():
+        try:
+            tamanos[(('archivo', os.path.basename(archivo)),)] = os.path.getsize(archivo)
+        except OSError:
+            pass
+    return tamanos
+
+
+metricas.contador('peticiones_total', 'Peticiones atendidas por endpoint, método y código')
+metricas.contador('errores_total', 'Respuestas 5xx y excepciones no controladas por endpoint')
+metricas.contador('rechazos_total', 'Peticiones rechazadas por límite por IP (429) o sobrecarga (503)')
+metricas.histograma('peticion_segundos', 'Duración de las peticiones por endpoint')
+metricas.histograma('operacion_segundos', 'Duración de operaciones internas')
+metricas.medidor('registros', 'Registros de asistencia guardados', lambda: almacen.total())
+metricas.medidor('datos_bytes', 'Tamaño de los archivos de datos', tamano_archivos)
+metricas.medidor('clientes_sse', 'Clientes conectados a /api/eventos', lambda: difusor.clientes)
+metricas.medidor('peticiones_en_curso', 'Peticiones atendidas en este momento',
+                 lambda: concurrencia.en_curso)
+metricas.medidor('limitador_ips', 'Cubetas en la tabla del limitador por IP',
+                 lambda: limitador.estadisticas()['claves'])
+
+
+def al_cerrar_formulario():
+    """Avisa a los navegadores en cuanto vence el plazo"""
+    difusor.publicar('temporizador', {"accion": "cerrar", "tiempo_restante": 0})
+
+
+# Plazo del formulario en memoria; solo iniciar, extender y detener escriben a disco
+temporizador = Temporizador(
+    almacen,
+    al_cerrar=al_cerrar_formulario,
+    revalidacion=float(os.getenv('TEMPORIZADOR_REVALIDACION', '1.0')),
+    cronometro=metricas.cronometro
+)
+
+# Forzar el volcado de registros pendientes al apagar el servidor
+atexit.register(almacen.cerrar)
 
 
-def guardar_estado(estado):
-    with open(ESTADO_ARCHIVO, 'w', encoding='utf-8') as f:
-        json.dump(estado, f, ensure_ascii=False, indent=2)
+def al_recibir_sigterm(signum, frame):
+    """Vuelca los registros pendientes antes de terminar el proceso"""
+    almacen.cerrar()
+    sys.exit(0)
+
+
+def nombre_endpoint():
+    """Regla de la ruta (/api/exportar/<formato>), no la URL, para acotar las series"""
+    return request.url_rule.rule if request.url_rule is not None else 'desconocido'
+
+
+@app.before_request
+def iniciar_medicion():
+    g.inicio_peticion = time.perf_counter()
+
+
+@app.after_request
+def registrar_medicion(response):
+    # En las respuestas por trozos (SSE, exportaciones) se mide hasta el primer byte
+    endpoint = nombre_endpoint()
+    metricas.observar('peticion_segundos', time.perf_counter() - g.inicio_peticion,
+                      endpoint=endpoint)
+    metricas.incrementar('peticiones_total', endpoint=endpoint, metodo=request.method,
+                         codigo=response.status_code)
+    if response.status_code >= 500:
+        metricas.incrementar('errores_total', endpoint=endpoint)
+    return response
+
+
+@app.before_request
+def aplicar_limites():
+    """429 si la IP agotó su cuota del endpoint; 503 si el servidor está saturado"""
+    endpoint = nombre_endpoint()
+    espera = limitador.consumir(endpoint, request.remote_addr)
+    if espera:
+        metricas.incrementar('rechazos_total', endpoint=endpoint, motivo='limite')
+        response = jsonify({
+            "ok": False,
+            "error": "Demasiadas peticiones. Intenta de nuevo en unos segundos."
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = segundos_reintento(espera)
+        return response
+
+    if request.endpoint in SIN_LIMITE_CONCURRENCIA:
+        return None
+    if not concurrencia.entrar():
+        # Mejor rechazar en el acto que dejar la petición esperando en cola
+        metricas.incrementar('rechazos_total', endpoint=endpoint, motivo='sobrecarga')
+        response = jsonify({"ok": False, "error": "Servidor ocupado. Intenta de nuevo."})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    g.en_curso = True
+    return None
+
+
+@app.teardown_request
+def liberar_concurrencia(excepcion):
+    # Las respuestas por trozos liberan su lugar al terminar de enviarse. Las
+    # excepciones no controladas ya se cuentan en after_request (respuesta 500)
+    if g.pop('en_curso', False):
+        concurrencia.salir()
+
+
+def sesion_vigente(sesion):
+    """La sesión no venció ni es anterior al último arranque del servidor"""
+    try:
+        inicio = datetime.fromisoformat(sesion['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    if INICIO_SERVIDOR and inicio < datetime.fromisoformat(INICIO_SERVIDOR):
+        return False
+    return datetime.now() - inicio < timedelta(hours=SESION_ADMIN_HORAS)
+
+
+def sesion_admin():
+    """Sesión de administrador vigente (vista por todos los workers)"""
+    almacen.actualizar()
+    sesion = almacen.meta.get('admin_sesion')
+    if not sesion or not sesion_vigente(sesion):
+        # Una sesión vencida no bloquea el login desde otra IP
+        return SESION_ADMIN_VACIA
+    return sesion
+
+
+def reiniciar_sesion_admin():
+    """Cierra cualquier sesión que haya quedado abierta antes de arrancar"""
+    if almacen.meta.get('admin_sesion'):
+        almacen.guardar_meta(admin_sesion=None)
 
 
 @app.route('/api/login', methods=['POST'])
@@ -89,26 +321,33 @@ def login_admin():
     if usuario == ADMIN_USUARIO:
         clave_hash = hashlib.sha256(clave.encode()).hexdigest()
         if clave_hash == ADMIN_CLAVE_HASH:
-            # Verificar si ya hay una sesión activa
-            if admin_sesion_activa["token"] is not None:
-                # Hay una sesión activa, verificar si es de la misma IP
-                if admin_sesion_activa["ip"] != cliente_ip:
-                    return jsonify({
-                        "ok": False,
-                        "error": "Ya hay un administrador conectado desde otra ubicación. Solo se permite una sesión activa."
-                    }), 403
-                else:
-                    # Misma IP, permitir reconexión (renovar token)
-                    pass
-
-            # Generar nuevo token único
-            nuevo_token = hashlib.sha256(
-                f"{usuario}{clave}{datetime.now().isoformat()}{cliente_ip}".encode()).hexdigest()[:16]
-
-            # Actualizar sesión activa
-            admin_sesion_activa["token"] = nuevo_token
-            admin_sesion_activa["timestamp"] = datetime.now().isoformat()
-            admin_sesion_activa["ip"] = cliente_ip
+            # Comprobar y tomar la sesión sin que otro worker se adelante
+            with almacen.transaccion():
+                sesion = sesion_admin()
+
+                # Verificar si ya hay una sesión activa
+                if sesion["token"] is not None:
+                    # Hay una sesión activa, verificar si es de la misma IP
+                    if sesion["ip"] != cliente_ip:
+                        return jsonify({
+                            "ok": False,
+                            "error": "Ya hay un administrador conectado desde otra ubicación. Solo se permite una sesión activa."
+                        }), 403
+                    else:
+                        # Misma IP, permitir reconexión (renovar token)
+                        pass
+
+                # Generar nuevo token único
+                nuevo_token = hashlib.sha256(
+                    f"{usuario}{clave}{datetime.now().isoformat()}{cliente_ip}".encode()).hexdigest()[:16]
+
+                # Actualizar sesión activa
+                almacen.guardar_meta(admin_sesion={
+                    "token": nuevo_token,
+                    "timestamp": datetime.now().isoformat(),
+                    "ip": cliente_ip
+                })
+            difusor.publicar('sesion', {"sesion_admin_activa": True})
 
             return jsonify({
                 "ok": True,
@@ -124,12 +363,13 @@ def login_admin():
 
 def verificar_token_admin(token, cliente_ip):
     """Verifica si el token es válido y corresponde a la sesión activa"""
-    if not token or admin_sesion_activa["token"] is None:
+    sesion = sesion_admin()
+    if not token or sesion["token"] is None:
         return False
 
     # Verificar token y IP
-    if (admin_sesion_activa["token"] == token and
-            admin_sesion_activa["ip"] == cliente_ip):
+    if (sesion["token"] == token and
+            sesion["ip"] == cliente_ip):
         return True
 
     return False
@@ -166,9 +406,8 @@ def cerrar_sesion():
     # Verificar que quien cierra sea el usuario logueado
     if verificar_token_admin(token, cliente_ip):
         # Limpiar sesión activa
-        admin_sesion_activa["token"] = None
-        admin_sesion_activa["timestamp"] = None
-        admin_sesion_activa["ip"] = None
+        almacen.guardar_meta(admin_sesion=None)
+        difusor.publicar('sesion', {"sesion_admin_activa": False})
 
         return jsonify({
             "ok": True,
@@ -181,12 +420,82 @@ def cerrar_sesion():
         }), 401
 
 
+def estado_publico():
+    """Resumen del estado para los participantes (sin datos personales)"""
+    almacen.actualizar()
+    return {
+        "tiempo_restante": temporizador.restante(),
+        "total": almacen.total(),
+        "sesion_admin_activa": sesion_admin()["token"] is not None
+    }
+
+
 @app.route('/api/estado', methods=['GET'])
 def obtener_estado():
-    estado = cargar_estado()
-    # Agregar información de sesión (sin exponer datos sensibles)
-    estado["sesion_admin_activa"] = admin_sesion_activa["token"] is not None
-    return jsonify(estado)
+    # Solo lo que necesita el formulario; los registros están en /api/registros
+    return jsonify(estado_publico())
+
+
+def token_de_consulta():
+    """Token de administrador en peticiones GET (cabecera o parámetro)"""
+    return request.headers.get('X-Admin-Token') or request.args.get('token', '')
+
+
+@app.route('/api/registros', methods=['GET'])
+def listar_registros():
+    """Registros posteriores a un seq, para que un cliente externo pida solo lo nuevo"""
+    if not verificar_token_admin(token_de_consulta(), request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    try:
+        desde = int(request.args.get('desde', 0))
+        limite = min(int(request.args.get('limite', 500)), 5000)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Parámetros desde/limite inválidos"}), 400
+    if desde < 0 or limite < 1:
+        return jsonify({"ok": False, "error": "Parámetros desde/limite inválidos"}), 400
+
+    registros, ultimo_seq = almacen.registros_desde(desde, limite)
+    siguiente = registros[-1]['seq'] if registros else desde
+    return jsonify({
+        "ok": True,
+        "registros": registros,
+        "desde": siguiente,
+        "hay_mas": siguiente < ultimo_seq,
+        "total": almacen.total(),
+        "generacion": almacen.generacion
+    })
+
+
+@app.route('/api/sesiones', methods=['GET'])
+def listar_sesiones():
+    """Historial de sesiones de asistencia (una por cada inicio del temporizador)"""
+    if not verificar_token_admin(token_de_consulta(), request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    almacen.actualizar()
+    return jsonify({
+        "ok": True,
+        "sesiones": almacen.sesiones(),
+        "sesion_actual": almacen.meta.get('sesion'),
+        "almacenamiento": ALMACENAMIENTO
+    })
+
+
+@app.route('/api/eventos', methods=['GET'])
+def eventos():
+    """Flujo SSE con los cambios de temporizador, registros y sesión"""
+    suscripcion = difusor.suscribir()
+    if suscripcion is None:
+        # El cliente vuelve al sondeo de /api/estado
+        return jsonify({"ok": False, "error": "Demasiados clientes conectados"}), 503
+
+    response = Response(
+        stream_with_context(difusor.flujo(suscripcion, estado_publico)),
+        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @app.route('/api/iniciar', methods=['POST'])
@@ -198,30 +507,36 @@ def iniciar_temporizador():
         return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
 
     minutos = data.get('minutos', 30)
-    tiempo_segundos = minutos * 60
+    tiempo_restante = temporizador.iniciar(minutos * 60)
 
-    estado = cargar_estado()
-    estado['tiempo_restante'] = tiempo_segundos
-    # Guardar tiempo inicial para cálculos
-    estado['tiempo_inicial'] = tiempo_segundos
-    estado['ultimo_inicio'] = datetime.now().isoformat()
-    guardar_estado(estado)
+    difusor.publicar('temporizador', {
+        "accion": "iniciar", "tiempo_restante": tiempo_restante})
 
     return jsonify({
         "ok": True,
-        "tiempo": estado['tiempo_restante'],
+        "tiempo": tiempo_restante,
         "minutos": minutos,
         "mensaje": f"Temporizador iniciado por {minutos} minutos"
     })
 
 
+@app.errorhandler(413)
+def contenido_demasiado_grande(error):
+    return jsonify({"ok": False, "error": "La petición es demasiado grande"}), 413
+
+
 @app.route('/api/registrar', methods=['POST'])
 def registrar_asistencia():
-    data = request.json
-    estado = cargar_estado()
+    # Solo los campos conocidos, sin espacios sobrantes y con longitud acotada
+    data, errores = ESQUEMA_REGISTRO.validar(request.get_json(silent=True))
+    if errores:
+        return jsonify({"ok": False, "error": primer_error(errores), "errores": errores}), 400
+
+    # El plazo está en memoria: comprobarlo no lee ningún archivo
+    tiempo_restante = temporizador.restante()
 
     # Verificar si el tiempo ha expirado
-    if estado['tiempo_restante'] <= 0:
+    if tiempo_restante <= 0:
         return jsonify({
             "ok": False,
             "error": "El tiempo para registrar asistencias ha expirado"
@@ -229,13 +544,151 @@ def registrar_asistencia():
 
     # Añadir fecha/hora del servidor (más confiable)
     data['fecha_hora_servidor'] = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    estado['registros'].append(data)
-    guardar_estado(estado)
+    # El índice por DNI detecta duplicados sin recorrer los registros
+    with metricas.cronometro('agregar'):
+        total, duplicado = almacen.agregar(data)
+    politica = almacen.politica_duplicados
+
+    if duplicado and politica == 'rechazar':
+        return jsonify({
+            "ok": False,
+            "error": "Este DNI ya está registrado",
+            "duplicado": True,
+            "politica": politica
+        }), 409
+
+    cache_excel.invalidar()
+    difusor.publicar('registros', {"total": total})
 
     return jsonify({
         "ok": True,
-        "total": len(estado['registros']),
-        "tiempo_restante": estado['tiempo_restante']
+        "total": total,
+        "tiempo_restante": tiempo_restante,
+        "duplicado": duplicado,
+        "politica": politica
+    })
+
+
+def milisegundos_a_fecha(valor):
+    """Fecha local de una marca de tiempo de JavaScript (ms), o None si no es válida"""
+    if not isinstance(valor, (int, float)) or isinstance(valor, bool):
+        return None
+    try:
+        return datetime.fromtimestamp(valor / 1000)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def sesion_en_gracia():
+    """Sesión recién cerrada cuyas asistencias sin conexión aún se aceptan, o None.
+
+    El plazo se mide con el reloj del servidor desde el cierre, así que no
+    depende de las horas que envía el navegador.
+    """
+    sesion = almacen.sesion_actual()
+    if sesion is None or not sesion.get('fin'):
+        return None
+    limite = datetime.fromisoformat(sesion['fin']) + timedelta(seconds=GRACIA_LOTE_SEGUNDOS)
+    return sesion if datetime.now() <= limite else None
+
+
+def capturado_en_sesion(registro, sesion, desfase):
+    """El registro se capturó mientras la sesión estaba abierta.
+
+    `capturado` es la hora del dispositivo al guardar la asistencia y
+    `desfase` la diferencia entre su reloj y el del servidor.
+    """
+    capturado = milisegundos_a_fecha(registro.get('capturado'))
+    if capturado is None or sesion is None or not sesion.get('fin'):
+        return False
+    momento = capturado + desfase
+    inicio, fin = datetime.fromisoformat(sesion['inicio']), datetime.fromisoformat(sesion['fin'])
+    return inicio <= momento <= fin
+
+
+@app.route('/api/registrar-lote', methods=['POST'])
+def registrar_lote():
+    """Registra varias asistencias en una sola petición y una sola escritura.
+
+    Lo usan los navegadores que guardaron asistencias sin conexión. Cada
+    registro trae un `id_cliente`: reenviar un lote ya guardado no crea filas
+    nuevas, así que el cliente puede reintentar sin riesgo.
+
+    Si el formulario se cerró hace menos de GRACIA_LOTE_SEGUNDOS, se aceptan
+    los registros capturados mientras la sesión estaba abierta (asistencias
+    guardadas sin conexión que llegan tarde); los demás, y todos pasado ese
+    plazo, reciben el estado `expirado`. El lote trae `enviado` (hora del
+    dispositivo) para corregir el desfase de su reloj.
+    """
+    data = request.get_json(silent=True)
+    registros = data.get('registros') if isinstance(data, dict) else None
+    if not isinstance(registros, list) or not registros:
+        return jsonify({"ok": False, "error": "Se esperaba una lista de registros"}), 400
+    if len(registros) > LOTE_MAXIMO:
+        return jsonify({
+            "ok": False,
+            "error": f"Máximo {LOTE_MAXIMO} registros por lote"
+        }), 413
+    if not all(isinstance(registro, dict) and isinstance(registro.get('id_cliente'), str)
+               and registro['id_cliente'] for registro in registros):
+        return jsonify({"ok": False, "error": "Cada registro necesita un id_cliente"}), 400
+
+    tiempo_restante = temporizador.restante()
+    sesion, desfase = None, timedelta(0)
+    if tiempo_restante <= 0:
+        # Formulario cerrado: solo las asistencias capturadas con la sesión abierta
+        sesion = sesion_en_gracia()
+        enviado = milisegundos_a_fecha(data.get('enviado'))
+        if enviado is not None:
+            desfase = datetime.now() - enviado
+
+    # Los registros rechazados se informan uno a uno; el resto del lote se guarda
+    fecha_hora = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    validos = []
+    rechazados = {}
+    for indice, registro in enumerate(registros):
+        if tiempo_restante <= 0 and not capturado_en_sesion(registro, sesion, desfase):
+            rechazados[indice] = ('expirado', "El tiempo para registrar asistencias ha expirado")
+            continue
+        limpio, errores_registro = ESQUEMA_LOTE.validar(registro)
+        if errores_registro:
+            rechazados[indice] = ('invalido', primer_error(errores_registro))
+        else:
+            limpio['fecha_hora_servidor'] = fecha_hora
+            validos.append(limpio)
+
+    total, estados_validos = almacen.total(), []
+    if validos:
+        with metricas.cronometro('agregar_lote'):
+            total, estados_validos = almacen.agregar_lote(validos)
+            # El cliente borra su cola al recibir la respuesta: escribir antes de responder
+            almacen.volcar()
+    politica = almacen.politica_duplicados
+    pendientes = iter(estados_validos)
+    resultados = []
+    for indice, registro in enumerate(registros):
+        if indice in rechazados:
+            estado, error = rechazados[indice]
+            resultados.append({"id_cliente": registro['id_cliente'], "estado": estado,
+                               "ok": False, "error": error})
+            continue
+        estado = next(pendientes)
+        resultados.append({
+            "id_cliente": registro['id_cliente'],
+            "estado": estado,
+            "ok": not (estado == 'duplicado' and politica == 'rechazar')
+        })
+
+    if any(estado != 'repetido' for estado in estados_validos):
+        cache_excel.invalidar()
+        difusor.publicar('registros', {"total": total})
+
+    return jsonify({
+        "ok": True,
+        "total": total,
+        "tiempo_restante": tiempo_restante,
+        "politica": politica,
+        "resultados": resultados
     })
 
 
@@ -249,38 +702,23 @@ def extender_temporizador():
 
     minutos_extra = data.get('minutos', 10)
 
-    estado = cargar_estado()
-
-    # Si hay un temporizador activo, extender el tiempo
-    if estado.get('ultimo_inicio') and estado.get('tiempo_inicial', 0) > 0:
-        # Calcular el nuevo tiempo inicial total
-        segundos_extra = minutos_extra * 60
-        estado['tiempo_inicial'] += segundos_extra
-
-        # Recalcular el tiempo restante
-        try:
-            inicio = datetime.fromisoformat(estado['ultimo_inicio'])
-            ahora = datetime.now()
-            transcurrido = int((ahora - inicio).total_seconds())
-            tiempo_restante = max(0, estado['tiempo_inicial'] - transcurrido)
-            estado['tiempo_restante'] = tiempo_restante
-        except:
-            estado['tiempo_restante'] = segundos_extra
-
-        guardar_estado(estado)
-
-        return jsonify({
-            "ok": True,
-            "tiempo_restante": estado['tiempo_restante'],
-            "minutos_agregados": minutos_extra,
-            "mensaje": f"Se agregaron {minutos_extra} minutos al temporizador"
-        })
-    else:
+    tiempo_restante = temporizador.extender(minutos_extra * 60)
+    if tiempo_restante is None:
         return jsonify({
             "ok": False,
             "error": "No hay un temporizador activo para extender"
         }), 400
 
+    difusor.publicar('temporizador', {
+        "accion": "extender", "tiempo_restante": tiempo_restante})
+
+    return jsonify({
+        "ok": True,
+        "tiempo_restante": tiempo_restante,
+        "minutos_agregados": minutos_extra,
+        "mensaje": f"Se agregaron {minutos_extra} minutos al temporizador"
+    })
+
 
 @app.route('/api/detener', methods=['POST'])
 def detener_temporizador():
@@ -290,11 +728,10 @@ def detener_temporizador():
     if not verificar_token_admin(token, request.remote_addr):
         return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
 
-    estado = cargar_estado()
-    estado['tiempo_restante'] = 0
-    estado['tiempo_inicial'] = 0
-    estado['ultimo_inicio'] = None
-    guardar_estado(estado)
+    temporizador.detener()
+
+    difusor.publicar('temporizador', {
+        "accion": "detener", "tiempo_restante": 0})
 
     return jsonify({
         "ok": True,
@@ -310,120 +747,298 @@ def limpiar_registros():
     if not verificar_token_admin(token, request.remote_addr):
         return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
 
-    estado = cargar_estado()
-    estado['registros'] = []
-    guardar_estado(estado)
+    almacen.limpiar()
+    cache_excel.invalidar()
+    difusor.publicar('registros', {"total": 0})
     return jsonify({"ok": True, "total": 0})
 
 
 @app.route('/api/descargar-excel', methods=['GET'])
 def descargar_excel():
-    estado = cargar_estado()
-    if not estado['registros']:
+    if 'sesion' in request.args:
+        return exportar_registros('xlsx')
+    if not verificar_token_admin(token_de_consulta(), request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    # Se reutiliza el último libro mientras los registros no hayan cambiado
+    # (la versión incluye lo que registraron los demás workers)
+    copia = cache_excel.obtener()
+    if copia is None:
         return 'No hay registros', 404
 
-    # Crear libro de Excel
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Asistencias"
-
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF")
-    header_fill = PatternFill(start_color="1E56A0",
-                              end_color="1E56A0", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    response = send_file(
+        io.BytesIO(copia.contenido),
+        mimetype=MIMETYPE_XLSX,
+        as_attachment=True,
+        download_name=f'asistencias_{copia.fecha.strftime("%Y%m%d_%H%M%S")}.xlsx',
+        etag=copia.version,
+        last_modified=copia.fecha
     )
+    # Revalidar siempre: el navegador recibe 304 si el ETag sigue vigente
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def registros_a_exportar(sesion=None):
+    """(registros, total, nombre base) de los registros actuales o de una sesión.
+
+    Lanza ValueError si `sesion` no es un número.
+    """
+    fecha = datetime.now().strftime("%Y%m%d_%H%M%S")
+    if sesion is not None:
+        sesion = int(sesion)
+        registros = almacen.registros_de_sesion(sesion)
+        return registros, len(registros), f'asistencias_sesion{sesion}_{fecha}'
 
-    # Encabezados
-    headers = ['APELLIDO PATERNO', 'APELLIDO MATERNO', 'NOMBRES', 'DNI', 'NÚMERO TELEFÓNICO',
-               'CORREO ELECTRÓNICO', 'ÁREA ORGANIZACIONAL', 'CENTRO DE TRABAJO', 'FECHA/HORA DE ASISTENCIA']
-
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = border
-
-    # Datos
-    for row, registro in enumerate(estado['registros'], 2):
-        datos = [
-            registro.get('apellido_paterno', ''),
-            registro.get('apellido_materno', ''),
-            registro.get('nombres', ''),
-            registro.get('dni', ''),
-            registro.get('cargo_numero_telefonico', ''),
-            registro.get('grupo_correo_electronico', ''),
-            registro.get('area_organizacional', ''),
-            registro.get('centro_trabajo', ''),
-            registro.get('fecha_hora_servidor', '')
-        ]
-
-        for col, valor in enumerate(datos, 1):
-            cell = ws.cell(row=row, column=col, value=valor)
-            cell.border = border
-            cell.alignment = Alignment(horizontal="left", vertical="center")
-
-    # Ajustar ancho de columnas
-    column_widths = [22, 22, 22, 12, 25, 30, 25, 25, 24]
-    for col, width in enumerate(column_widths, 1):
-        ws.column_dimensions[ws.cell(
-            row=1, column=col).column_letter].width = width
-
-    # Agregar información adicional
-    info_row = len(estado['registros']) + 3
-    ws.cell(row=info_row, column=1,
-            value="Total de registros:").font = Font(bold=True)
-    cell_total = ws.cell(row=info_row, column=2,
-                         value=len(estado['registros']))
-    cell_total.alignment = Alignment(horizontal="left")
-
-    ws.cell(row=info_row + 1, column=1,
-            value="Fecha de generación:").font = Font(bold=True)
-    cell_fecha = ws.cell(row=info_row + 1, column=2,
-                         value=datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
-    cell_fecha.alignment = Alignment(horizontal="left")
-
-    # Guardar en memoria
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # Crear respuesta
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    response.headers[
-        'Content-Disposition'] = f'attachment; filename="asistencias_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx"'
+    # Los pendientes de la escritura diferida también se exportan
+    almacen.volcar()
+    almacen.actualizar()
+    total = almacen.total()
+    # Se leen del almacenamiento por páginas mientras se escribe el archivo
+    registros = recorrer_registros(almacen.registros_desde) if total else []
+    return registros, total, f'asistencias_{fecha}'
 
+
+@app.route('/api/exportar/<formato>', methods=['GET'])
+def exportar_registros(formato):
+    """Exporta los registros actuales, o los de `?sesion=<id>`, en el formato pedido.
+
+    El archivo se envía por trozos mientras se genera (ver exportacion.FORMATOS).
+    """
+    if formato not in FORMATOS:
+        return jsonify({
+            "ok": False,
+            "error": f"Formato no soportado (usa {', '.join(FORMATOS)})"
+        }), 404
+    if not verificar_token_admin(token_de_consulta(), request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    try:
+        registros, _, nombre = registros_a_exportar(request.args.get('sesion'))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Sesión inválida"}), 400
+    if not registros:
+        return 'No hay registros', 404
+
+    exportacion = FORMATOS[formato]
+    response = Response(stream_with_context(exportacion.escritor(registros)),
+                        mimetype=exportacion.mimetype)
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{nombre}.{exportacion.extension}"')
+    response.headers['Cache-Control'] = 'private, no-store'
     return response
 
-# Servir archivos estáticos (HTML, CSS, JS)
+
+@app.route('/api/metricas', methods=['GET'])
+def exponer_metricas():
+    """Métricas de este worker en formato de texto de Prometheus.
+
+    Acepta el token de la sesión de administrador o, si está configurado,
+    METRICAS_TOKEN (cabecera Authorization: Bearer o ?token=).
+    """
+    token = token_de_consulta()
+    autorizacion = request.headers.get('Authorization', '')
+    if autorizacion.startswith('Bearer '):
+        token = autorizacion[len('Bearer '):]
+    token_fijo = METRICAS_TOKEN and hmac.compare_digest(token.encode(), METRICAS_TOKEN.encode())
+    if not token_fijo and not verificar_token_admin(token, request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    almacen.actualizar()
+    response = Response(metricas.formatear(), mimetype=MIMETYPE_PROMETHEUS)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/api/exportaciones', methods=['POST'])
+def crear_exportacion():
+    """Encola una exportación y devuelve su id sin esperar a que termine"""
+    data = request.get_json(silent=True) or {}
+    if not verificar_token_admin(data.get('admin_token', ''), request.remote_addr):
+        return jsonify({"ok": False, "error": "Token de administrador inválido"}), 401
+
+    formato = data.get('formato', 'xlsx')
+    if formato not in FORMATOS:
+        return jsonify({
+            "ok": False,
+            "error": f"Formato no soportado (usa {', '.join(FORMATOS)})"
+        }), 400
+    try:
+        registros, total, nombre = registros_a_exportar(data.get('sesion'))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Sesión inválida"}), 400
+    if not total:
+        return jsonify({"ok": False, "error": "No hay registros"}), 404
+
+    trabajo = exportaciones.encolar(formato, registros, total, nombre)
+    if trabajo is None:
+        response = jsonify({"ok": False, "error": "Hay demasiadas exportaciones en curso"})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    return jsonify({"ok": True, **trabajo}), 202
+
+
+def trabajo_de_exportacion(id_trabajo):
+    """Trabajo pedido por el administrador, o la respuesta de error"""
+    if not verificar_token_admin(token_de_consulta(), request.remote_addr):
+        return None, (jsonify({"ok": False, "error": "Token de administrador inválido"}), 401)
+    trabajo = exportaciones.estado(id_trabajo)
+    if trabajo is None:
+        return None, (jsonify({"ok": False, "error": "Exportación no encontrada o vencida"}), 404)
+    return trabajo, None
+
+
+@app.route('/api/exportaciones/<id_trabajo>', methods=['GET'])
+def estado_exportacion(id_trabajo):
+    """Avance de una exportación: estado y filas escritas de `total`"""
+    trabajo, error = trabajo_de_exportacion(id_trabajo)
+    if error:
+        return error
+    response = jsonify({"ok": True, **trabajo})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/api/exportaciones/<id_trabajo>/archivo', methods=['GET'])
+def descargar_exportacion(id_trabajo):
+    trabajo, error = trabajo_de_exportacion(id_trabajo)
+    if error:
+        return error
+    if trabajo['estado'] != 'listo':
+        return jsonify({"ok": False, "error": "La exportación aún no termina",
+                        "estado": trabajo['estado']}), 409
+
+    response = send_file(
+        os.path.abspath(exportaciones.archivo(trabajo)),
+        mimetype=FORMATOS[trabajo['formato']].mimetype,
+        as_attachment=True,
+        download_name=trabajo['nombre']
+    )
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """El proceso responde (para reiniciarlo si se cuelga)"""
+    return jsonify({"ok": True, "pid": os.getpid()})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """El almacenamiento está cargado y se puede leer"""
+    try:
+        almacen.actualizar()
+        total = almacen.total()
+    except Exception as e:
+        return jsonify({"ok": False, "almacenamiento": ALMACENAMIENTO, "error": str(e)}), 503
+    return jsonify({
+        "ok": True,
+        "almacenamiento": ALMACENAMIENTO,
+        "total": total,
+        "tiempo_carga_s": round(TIEMPO_CARGA, 4),
+        "tiempo_arranque_s": round(TIEMPO_ARRANQUE, 4)
+    })
+
+# Servir archivos estáticos (HTML, CSS, JS) desde memoria
+
+
+def servir_recurso(nombre):
+    # En desarrollo se recargan si se editan (en producción no se toca el disco)
+    if app.debug:
+        recursos.recargar_si_cambio()
+    recurso = recursos.buscar(nombre)
+    if recurso is None:
+        return "Archivo no encontrado", 404
+
+    codificacion, contenido = recurso.variante(request.headers.get('Accept-Encoding'))
+    response = Response(contenido, mimetype=recurso.mimetype)
+    if codificacion != 'identity':
+        response.headers['Content-Encoding'] = codificacion
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Cada variante comprimida es una representación distinta
+    response.set_etag(f"{recurso.huella}-{codificacion}")
+    if recurso.inmutable:
+        # El nombre cambia con el contenido: se puede guardar un año sin revalidar
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'no-cache'
+    # Responde 304 si el navegador ya tiene esta versión
+    return response.make_conditional(request)
 
 
 @app.route('/')
 def index():
-    return send_from_directory('.', 'index.html')
+    return servir_recurso('index.html')
 
-# ✅ Sirve CSS, JS y otros archivos desde la misma carpeta
+# ✅ Solo se sirven los archivos registrados en estaticos.py
 
 
 @app.route('/<path:filename>')
 def archivos_estaticos(filename):
-    # Solo permitir archivos que existan y no sean peligrosos
-    if os.path.isfile(filename) and not filename.startswith('.'):
-        return send_from_directory('.', filename)
-    return "Archivo no encontrado", 404
+    return servir_recurso(filename)
+
+
+def servir_produccion(puerto, hilos):
+    """Servidor WSGI multihilo sin recargador ni depurador.
+
+    Usa waitress (funciona también en Windows) si está instalado; si no, el
+    servidor multihilo de Werkzeug. Para varios procesos usar gunicorn con
+    wsgi.py (ver gunicorn.conf.py).
+    """
+    # Cada conexión SSE ocupa un hilo: reservar la mitad para las demás peticiones
+    difusor.max_clientes = min(difusor.max_clientes, max(1, hilos // 2))
+    if not concurrencia.maximo:
+        # Con todos los hilos ocupados las peticiones esperarían en cola; los
+        # que usan las conexiones SSE abiertas se descuentan al entrar
+        concurrencia.maximo = hilos
+
+    try:
+        from waitress import serve
+    except ImportError:
+        print("⚠️  waitress no está instalado (pip install waitress); "
+              "se usa el servidor multihilo de Werkzeug")
+        from werkzeug.serving import run_simple
+        run_simple('0.0.0.0', puerto, app, threaded=True)
+        return
+
+    serve(app, host='0.0.0.0', port=puerto, threads=hilos,
+          connection_limit=int(os.getenv('LIMITE_CONEXIONES', '1000')))
+
+
+def parsear_argumentos():
+    parser = argparse.ArgumentParser(
+        description='Servidor del formulario de asistencia')
+    parser.add_argument('--produccion', action='store_true',
+                        help='servidor WSGI multihilo, sin recargador ni depurador')
+    parser.add_argument('--puerto', type=int, default=int(os.getenv('PUERTO', '8080')),
+                        help='puerto de escucha (defecto: 8080)')
+    parser.add_argument('--hilos', type=int, default=int(os.getenv('HILOS', '32')),
+                        help='hilos de atención en modo producción (defecto: 32)')
+    return parser.parse_args()
+
+
+# Configuración completa: almacenamiento, archivos estáticos y componentes
+TIEMPO_ARRANQUE = time.perf_counter() - _inicio_arranque
 
 
 if __name__ == '__main__':
+    args = parsear_argumentos()
     ip_local = obtener_ip_local()
-    print(f"Servidor iniciado en http://{ip_local}:8080")
-    print("Servidor iniciado en http://localhost:8080")
+    print(f"Servidor iniciado en http://{ip_local}:{args.puerto}")
+    print(f"Servidor iniciado en http://localhost:{args.puerto}")
     print("Presiona Ctrl+C para detener el servidor.")
 
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    signal.signal(signal.SIGTERM, al_recibir_sigterm)
+
+    if args.produccion:
+        reiniciar_sesion_admin()
+        print(f"Modo producción: {args.hilos} hilos")
+        servir_produccion(args.puerto, args.hilos)
+    else:
+        # Con el recargador este bloque corre dos veces; solo el proceso
+        # hijo (el que atiende) debe cerrar la sesión anterior
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            reiniciar_sesion_admin()
+        app.run(host='0.0.0.0', port=args.puerto, debug=True)
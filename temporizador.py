@@ -0,0 +1,145 @@
+"""
+Temporizador del formulario de asistencia.
+
+El plazo se guarda en memoria como un instante de time.monotonic(): saber si
+el formulario está abierto y cuántos segundos quedan es una resta, sin leer
+archivos ni interpretar fechas. Solo iniciar, extender y detener escriben en
+el almacenamiento (ultimo_inicio y tiempo_inicial, como antes).
+
+Al llegar el plazo se dispara `al_cerrar` desde un hilo temporizado, así los
+navegadores se enteran del cierre sin esperar a la siguiente petición.
+
+Con varios workers, los cambios hechos por otro proceso se notan al revisar
+los metadatos del almacenamiento, como mucho una vez cada `revalidacion`
+segundos (o en cuanto otra petición los actualiza).
+"""
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from metricas import sin_medicion
+
+
+class Temporizador:
+    """Plazo de registro de asistencias, compartido con los demás workers"""
+
+    def __init__(self, almacen, al_cerrar=None, revalidacion=1.0, cronometro=sin_medicion):
+        self._almacen = almacen
+        self._al_cerrar = al_cerrar
+        self.revalidacion = revalidacion
+        self._cronometro = cronometro
+        self._cerrojo = threading.Lock()
+        self._fin = None
+        # (ultimo_inicio, tiempo_inicial) de los metadatos con que se calculó el plazo
+        self._origen = None
+        self._proxima_revision = 0.0
+        self._programado = None
+        self._sincronizar(almacen.meta)
+
+        # Con gunicorn --preload el hilo temporizado no pasa a los workers
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        self._cerrojo = threading.Lock()
+        self._programado = None
+        self._programar()
+
+    # --- Consultas (sin acceso a disco) ---
+
+    def restante(self):
+        """Segundos que quedan para registrar (0 si el formulario está cerrado)"""
+        self._revisar()
+        fin = self._fin
+        if fin is None:
+            return 0
+        return max(0, math.ceil(fin - time.monotonic()))
+
+    def abierto(self):
+        return self.restante() > 0
+
+    def _revisar(self):
+        ahora = time.monotonic()
+        if ahora >= self._proxima_revision:
+            self._proxima_revision = ahora + self.revalidacion
+            self._almacen.actualizar()
+        self._sincronizar(self._almacen.meta)
+
+    def _sincronizar(self, meta):
+        """Recalcula el plazo solo si los metadatos del temporizador cambiaron"""
+        origen = (meta.get('ultimo_inicio'), meta.get('tiempo_inicial', 0))
+        if origen == self._origen:
+            return
+        with self._cerrojo:
+            if origen == self._origen:
+                return
+            with self._cronometro('temporizador_recalcular'):
+                ultimo_inicio, tiempo_inicial = origen
+                self._fin = None
+                if ultimo_inicio and tiempo_inicial > 0:
+                    try:
+                        fin = datetime.fromisoformat(ultimo_inicio) + timedelta(seconds=tiempo_inicial)
+                        self._fin = time.monotonic() + (fin - datetime.now()).total_seconds()
+                    except ValueError:
+                        pass
+                self._origen = origen
+            self._programar()
+
+    # --- Cambios (se guardan en el almacenamiento) ---
+
+    def _guardar(self, tiempo_inicial, ultimo_inicio):
+        with self._cronometro('temporizador_guardar'):
+            self._almacen.guardar_meta(tiempo_inicial=tiempo_inicial, ultimo_inicio=ultimo_inicio)
+        self._sincronizar(self._almacen.meta)
+
+    def iniciar(self, segundos):
+        """Abre el formulario durante `segundos`; devuelve el tiempo restante"""
+        with self._almacen.transaccion():
+            self._guardar(segundos, datetime.now().isoformat())
+        return self.restante()
+
+    def extender(self, segundos):
+        """Agrega segundos al temporizador vigente; None si no hay ninguno"""
+        # Lectura-modificación-escritura protegida frente a otros hilos y workers
+        with self._almacen.transaccion():
+            meta = self._almacen.meta
+            if not (meta.get('ultimo_inicio') and meta.get('tiempo_inicial', 0) > 0):
+                return None
+            self._guardar(meta['tiempo_inicial'] + segundos, meta['ultimo_inicio'])
+        return self.restante()
+
+    def detener(self):
+        with self._almacen.transaccion():
+            self._guardar(0, None)
+
+    # --- Cierre automático ---
+
+    def _programar(self):
+        """Reprograma el aviso de cierre para el plazo vigente"""
+        if self._programado is not None:
+            self._programado.cancel()
+            self._programado = None
+        if self._fin is None or self._al_cerrar is None:
+            return
+        espera = self._fin - time.monotonic()
+        if espera <= 0:
+            return
+        self._programado = threading.Timer(espera, self._al_vencer, args=(self._origen,))
+        self._programado.daemon = True
+        self._programado.start()
+
+    def _al_vencer(self, origen):
+        # Otro worker pudo extender o detener el temporizador mientras tanto
+        self._revisar()
+        if self._origen != origen:
+            return
+        if self._fin is not None and self._fin > time.monotonic():
+            with self._cerrojo:
+                self._programar()
+            return
+        try:
+            self._al_cerrar()
+        except Exception as e:
+            print(f"⚠️  No se pudo avisar el cierre del formulario: {e}")
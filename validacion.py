@@ -0,0 +1,82 @@
+"""
+Validación de las asistencias que envían los navegadores.
+
+El esquema y las expresiones regulares se compilan una sola vez al importar.
+Cada registro se reduce a los campos conocidos (los que se exportan), sin
+espacios sobrantes y con una longitud máxima por campo: lo que se guarda
+tiene un tamaño acotado, así que escribir, cargar y exportar cuesta lo mismo
+sin importar lo que envíe el cliente. Los campos desconocidos se descartan.
+"""
+import re
+from collections import namedtuple
+
+# Texto de una línea, sin caracteres de control (tampoco los admite openpyxl)
+PATRON_TEXTO = re.compile(r'[^\x00-\x1f\x7f]+')
+PATRON_DNI = re.compile(r'[0-9]{8}')
+PATRON_TELEFONO = re.compile(r'\+?[0-9]{6,15}')
+PATRON_CORREO = re.compile(r'[^@\s]+@[^@\s.]+(\.[^@\s.]+)+')
+PATRON_ID_CLIENTE = re.compile(r'[A-Za-z0-9-]+')
+
+# nombre, longitud máxima, patrón y mensaje de error
+Campo = namedtuple('Campo', 'nombre maximo patron mensaje')
+
+CAMPOS_REGISTRO = (
+    Campo('apellido_paterno', 80, PATRON_TEXTO, 'Apellido paterno inválido'),
+    Campo('apellido_materno', 80, PATRON_TEXTO, 'Apellido materno inválido'),
+    Campo('nombres', 100, PATRON_TEXTO, 'Nombres inválidos'),
+    Campo('dni', 8, PATRON_DNI, 'El DNI debe tener exactamente 8 dígitos'),
+    Campo('cargo_numero_telefonico', 16, PATRON_TELEFONO, 'Número telefónico inválido'),
+    Campo('grupo_correo_electronico', 254, PATRON_CORREO, 'Correo electrónico inválido'),
+    Campo('area_organizacional', 150, PATRON_TEXTO, 'Unidad de organización inválida'),
+    Campo('centro_trabajo', 150, PATRON_TEXTO, 'Centro de trabajo inválido'),
+)
+
+CAMPO_ID_CLIENTE = Campo('id_cliente', 64, PATRON_ID_CLIENTE, 'id_cliente inválido')
+
+
+class Esquema:
+    """Campos obligatorios de un registro, con su longitud máxima y su patrón"""
+
+    def __init__(self, campos):
+        self.campos = tuple(campos)
+
+    def validar(self, datos):
+        """Devuelve (registro limpio, errores por campo); con errores el registro es None"""
+        if not isinstance(datos, dict):
+            return None, {'registro': 'Se esperaba un objeto JSON'}
+
+        limpio = {}
+        errores = {}
+        for campo in self.campos:
+            valor = datos.get(campo.nombre)
+            if isinstance(valor, int) and not isinstance(valor, bool):
+                valor = str(valor)
+            if not isinstance(valor, str) or not valor.strip():
+                errores[campo.nombre] = 'Campo obligatorio'
+                continue
+            valor = valor.strip()
+            if len(valor) > campo.maximo:
+                errores[campo.nombre] = f'Máximo {campo.maximo} caracteres'
+            elif not campo.patron.fullmatch(valor):
+                errores[campo.nombre] = campo.mensaje
+            else:
+                limpio[campo.nombre] = valor
+
+        if errores:
+            return None, errores
+        return limpio, {}
+
+
+# Formulario (/api/registrar) y cola sin conexión (/api/registrar-lote)
+ESQUEMA_REGISTRO = Esquema(CAMPOS_REGISTRO)
+ESQUEMA_LOTE = Esquema(CAMPOS_REGISTRO + (CAMPO_ID_CLIENTE,))
+
+
+def primer_error(errores):
+    """Mensaje para mostrar al participante"""
+    campo, mensaje = next(iter(errores.items()))
+    if mensaje == 'Campo obligatorio':
+        return 'Todos los campos son obligatorios'
+    if mensaje.startswith('Máximo'):
+        return f'{campo}: {mensaje.lower()}'
+    return mensaje
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 """
 Script de prueba para verificar las dependencias del formulario de asistencia
+
+Solo busca los módulos (importlib.util.find_spec), sin importarlos: la
+verificación es inmediata aunque Flask u openpyxl tarden en cargarse.
 """
+import importlib.util
 
 def verificar_dependencias():
     dependencias = {
         'Flask': 'flask',
-        'openpyxl': 'openpyxl'
+        'openpyxl': 'openpyxl',
+        'python-dotenv': 'dotenv'
     }
     
     print("🔍 Verificando dependencias...")
@@ -15,12 +20,11 @@ def verificar_dependencias():
     faltantes = []
     
     for nombre, modulo in dependencias.items():
-        try:
-            __import__(modulo)
+        if importlib.util.find_spec(modulo) is not None:
             print(f"✅ {nombre}: OK")
-        except ImportError:
+        else:
             print(f"❌ {nombre}: FALTANTE")
-            faltantes.append(modulo)
+            faltantes.append(nombre)
     
     print("-" * 40)
     
@@ -0,0 +1,17 @@
+"""
+Punto de entrada WSGI para servidores de producción.
+
+Varios procesos (Linux/macOS), usando gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Un solo proceso multihilo (también en Windows):
+    python3 servidor.py --produccion --hilos 32
+
+Los registros, el temporizador y la sesión de administrador se comparten entre
+workers a través de los archivos de almacenamiento (ver almacenamiento.py).
+La sesión de administrador se descarta al reiniciar gunicorn (on_starting en
+gunicorn.conf.py) y, con cualquier servidor, vence a las SESION_ADMIN_HORAS.
+"""
+from servidor import app
+
+__all__ = ['app']